@@ -0,0 +1,360 @@
+# benchmark.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import argparse
+import csv
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+# 结果记录中的字段顺序（CSV 表头）
+FIELDS = [
+    'engine', 'resolution', 'storage', 'query_cache', 'covering_cache',
+    'bbox_size', 'queries', 'repeat', 'exact_check', 'geometry_check',
+    'min_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+    'throughput_qps', 'mean_candidates', 'mean_results', 'feature_count',
+    'build_s', 'load_s', 'index_bytes'
+]
+
+# 与基线比较时用来对应同一测试项的字段
+CASE_KEYS = ('engine', 'resolution', 'storage', 'query_cache',
+             'covering_cache', 'bbox_size', 'exact_check', 'geometry_check',
+             'feature_count')
+
+
+def make_bboxes(extent, size, count, seed=0):
+    """在 extent 范围内随机生成 count 个边长为 size（度）的查询 bbox"""
+    min_x, min_y, max_x, max_y = extent
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(min_x, max(min_x, max_x - size), count)
+    y = rng.uniform(min_y, max(min_y, max_y - size), count)
+    return np.column_stack([x, y, x + size, y + size])
+
+
+def percentiles(samples_ns):
+    """由纳秒耗时样本计算统计量（毫秒）"""
+    ms = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        'min_ms': float(ms.min()),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(ms.max())
+    }
+
+
+class Benchmark:
+    """查询性能测试
+
+    每个测试项先预热 warmup 轮，再对同一组 bbox 重复 repeat 轮，逐次以
+    perf_counter_ns 计时。计时只包含 SpatialIndex.query()，不包含输出。
+    """
+
+    def __init__(self,
+                 engines,
+                 warmup=3,
+                 repeat=20,
+                 exact_check=False,
+                 geometry_check=False):
+        self.engines = engines
+        self.warmup = warmup
+        self.repeat = repeat
+        self.exact_check = exact_check
+        self.geometry_check = geometry_check
+
+    def run_case(self, name, engine, bboxes, bbox_size=None):
+        """对一个引擎测试一组 bbox，返回结果记录"""
+        bboxes = [tuple(bbox) for bbox in np.asarray(bboxes).tolist()]
+        for _ in range(self.warmup):
+            for bbox in bboxes:
+                engine.query(bbox, self.exact_check, self.geometry_check)
+
+        samples = np.empty(len(bboxes) * self.repeat, dtype=np.int64)
+        candidates = results = 0
+        i = 0
+        total_start = time.perf_counter_ns()
+        for _ in range(self.repeat):
+            for bbox in bboxes:
+                start = time.perf_counter_ns()
+                candidate_fids, result_fids = engine.query(
+                    bbox, self.exact_check, self.geometry_check)
+                samples[i] = time.perf_counter_ns() - start
+                i += 1
+                candidates += len(candidate_fids)
+                results += len(result_fids)
+        total_ns = time.perf_counter_ns() - total_start
+
+        record = {
+            'engine': name,
+            'resolution': engine.resolution,
+            'storage': getattr(engine, 'storage',
+                               getattr(engine, 'backend', None)),
+            'query_cache': engine.query_cache is not None,
+            'covering_cache': engine.covering_cache is not None,
+            'bbox_size': bbox_size,
+            'queries': len(bboxes),
+            'repeat': self.repeat,
+            'exact_check': self.exact_check,
+            'geometry_check': self.geometry_check
+        }
+        record.update(percentiles(samples))
+        record['throughput_qps'] = len(samples) / (total_ns / 1e9)
+        record['mean_candidates'] = candidates / len(samples)
+        record['mean_results'] = results / len(samples)
+        return record
+
+    def sweep(self, sizes, extent, count=100, seed=0):
+        """按 bbox 边长扫描：每个边长生成同一组 bbox，依次测试全部引擎"""
+        records = []
+        for size in sizes:
+            bboxes = make_bboxes(extent, size, count, seed)
+            for name, engine in self.engines.items():
+                record = self.run_case(name, engine, bboxes, size)
+                records.append(record)
+                print(f"{name:>12} size={size:<8g} "
+                      f"p50={record['p50_ms']:.3f}ms "
+                      f"p95={record['p95_ms']:.3f}ms "
+                      f"p99={record['p99_ms']:.3f}ms "
+                      f"{record['throughput_qps']:.0f} q/s")
+        return records
+
+
+def environment():
+    """记录测试环境，写入 JSON 结果"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def write_json(records, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'environment': environment(),
+            'records': records
+        },
+                  f,
+                  ensure_ascii=False,
+                  indent=2)
+
+
+def write_csv(records, path, fields=FIELDS):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for record in records:
+            writer.writerow({key: record.get(key) for key in fields})
+
+
+def load_records(path):
+    """读取 write_json 写出的结果（或基线）"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['records']
+
+
+def compare_baseline(records, baseline, metric='p50_ms', tolerance=0.1):
+    """与基线逐项比较，返回 metric 变慢超过 tolerance 比例的测试项"""
+    base = {tuple(r.get(k) for k in CASE_KEYS): r for r in baseline}
+    regressions = []
+    for record in records:
+        old = base.get(tuple(record.get(k) for k in CASE_KEYS))
+        if old is None or not old[metric]:
+            continue
+        ratio = record[metric] / old[metric]
+        if ratio > 1 + tolerance:
+            regressions.append({
+                'engine': record['engine'],
+                'resolution': record['resolution'],
+                'bbox_size': record['bbox_size'],
+                'metric': metric,
+                'baseline': old[metric],
+                'current': record[metric],
+                'ratio': ratio
+            })
+    return regressions
+
+
+def make_engine(name, data_path, index_file, resolution=None):
+    """按名称创建引擎，resolution 为 None 时使用各引擎默认值"""
+    from rtree_index import RtreeIndex
+    from geohash_index import GeoHashSpatialIndex
+    from s2_index import S2SpatialIndex
+    from h3_index import H3SpatialIndex
+
+    if name == 'Rtree':
+        return RtreeIndex(data_path, index_file)
+    if name == 'GeoHash':
+        return GeoHashSpatialIndex(data_path,
+                                   index_file,
+                                   precision=resolution or 7)
+    if name == 'S2':
+        return S2SpatialIndex(data_path,
+                              index_file,
+                              resolution=resolution or 15)
+    if name == 'H3':
+        return H3SpatialIndex(data_path,
+                              index_file,
+                              resolution=resolution or 9)
+    raise ValueError(f"不支持的引擎: {name}")
+
+
+def build_engines(data_path, index_dir, names, resolutions=None):
+    """按名称创建引擎（可按分辨率展开为多个），缺少索引文件的共用一次扫描构建"""
+    from index_builder import IndexBuilder
+
+    engines = {}
+    builder = IndexBuilder(data_path)
+    for name in names:
+        levels = [None] if name == 'Rtree' or not resolutions else resolutions
+        for res in levels:
+            label = name if res is None else f"{name}-{res}"
+            index_file = os.path.join(index_dir, f"{label.lower()}.spx")
+            engines[label] = builder.register(
+                label, make_engine(name, data_path, index_file, res))
+    builder.build([
+        label for label, engine in engines.items()
+        if not os.path.exists(engine.index_file)
+    ])
+    return engines
+
+
+def run_scaling(data_dir,
+                counts,
+                names,
+                sizes,
+                resolution=None,
+                count=100,
+                warmup=3,
+                repeat=20,
+                seed=0,
+                **dataset_options):
+    """规模测试：对每个要素数量生成合成数据，逐个引擎计时 build_index、
+    load_index 并测试查询，记录中附加要素数、构建/加载耗时与索引文件大小
+    """
+    from synthetic_data import DEFAULT_EXTENT, generate_dataset
+
+    extent = dataset_options.get('extent', DEFAULT_EXTENT)
+    records = []
+    for feature_count in counts:
+        feature_count = int(feature_count)
+        data_path = os.path.join(data_dir, f"synthetic_{feature_count}.gpkg")
+        generate_dataset(data_path, feature_count, seed=seed,
+                         **dataset_options)
+        for name in names:
+            index_file = os.path.join(data_dir, 'index',
+                                      f"{name.lower()}_{feature_count}.spx")
+            if os.path.exists(index_file):
+                os.remove(index_file)
+            engine = make_engine(name, data_path, index_file, resolution)
+            start = time.perf_counter()
+            engine.build_index()
+            build_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            engine = make_engine(name, data_path, index_file, resolution)
+            load_s = time.perf_counter() - start
+
+            benchmark = Benchmark({name: engine}, warmup, repeat)
+            for size in sizes:
+                record = benchmark.run_case(
+                    name, engine, make_bboxes(extent, size, count, seed),
+                    size)
+                record.update({
+                    'feature_count': feature_count,
+                    'build_s': build_s,
+                    'load_s': load_s,
+                    'index_bytes': os.path.getsize(index_file)
+                })
+                records.append(record)
+                print(f"{name:>12} n={feature_count:<9d} size={size:<8g} "
+                      f"build={build_s:.2f}s load={load_s:.3f}s "
+                      f"p50={record['p50_ms']:.3f}ms "
+                      f"p95={record['p95_ms']:.3f}ms")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="空间索引查询性能测试")
+    parser.add_argument('data', help="数据源路径；规模测试时为合成数据目录")
+    parser.add_argument('--engines', default='Rtree,GeoHash,S2,H3')
+    parser.add_argument('--resolutions', default='',
+                        help="逗号分隔的分辨率，为空时使用各引擎默认值")
+    parser.add_argument('--index-dir', default='./index_py/bench')
+    parser.add_argument('--sizes', default='0.001,0.01,0.1,1',
+                        help="逗号分隔的 bbox 边长（度）")
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--exact', action='store_true')
+    parser.add_argument('--geometry', action='store_true')
+    parser.add_argument('--scale',
+                        help="逗号分隔的要素数量，给出时对合成数据做规模测试")
+    parser.add_argument('--geometry-type', default='polygon',
+                        help="规模测试的几何类型: point/line/polygon")
+    parser.add_argument('--distribution', default='uniform',
+                        help="规模测试的空间分布: uniform/clustered/city")
+    parser.add_argument('--json')
+    parser.add_argument('--csv')
+    parser.add_argument('--baseline', help="用于比较的基线 JSON")
+    parser.add_argument('--metric', default='p50_ms')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    resolutions = [int(r) for r in args.resolutions.split(',') if r]
+    sizes = [float(s) for s in args.sizes.split(',')]
+    if args.scale:
+        records = run_scaling(args.data,
+                              [float(n) for n in args.scale.split(',')],
+                              args.engines.split(','),
+                              sizes,
+                              resolutions[0] if resolutions else None,
+                              args.count,
+                              args.warmup,
+                              args.repeat,
+                              args.seed,
+                              geometry_type=args.geometry_type,
+                              distribution=args.distribution)
+    else:
+        engines = build_engines(args.data, args.index_dir,
+                                args.engines.split(','), resolutions)
+        extent = next(iter(engines.values())).feature_bounds.boxes
+        extent = (extent[0].min(), extent[1].min(), extent[2].max(),
+                  extent[3].max())
+
+        benchmark = Benchmark(engines, args.warmup, args.repeat, args.exact,
+                              args.geometry)
+        records = benchmark.sweep(sizes, extent, args.count, args.seed)
+    if args.json:
+        write_json(records, args.json)
+    if args.csv:
+        write_csv(records, args.csv)
+    if args.baseline:
+        regressions = compare_baseline(records, load_records(args.baseline),
+                                       args.metric, args.tolerance)
+        for r in regressions:
+            print(f"性能退化: {r['engine']} res={r['resolution']} "
+                  f"size={r['bbox_size']} {r['metric']} "
+                  f"{r['baseline']:.3f} -> {r['current']:.3f}ms "
+                  f"(x{r['ratio']:.2f})")
+        if regressions:
+            raise SystemExit(1)
+        print("未发现性能退化")
+
+
+if __name__ == "__main__":
+    main()
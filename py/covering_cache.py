@@ -0,0 +1,105 @@
+# covering_cache.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import math
+from collections import OrderedDict
+from itertools import chain
+
+import numpy as np
+
+
+def merge_coverings(parts):
+    """合并若干瓦片的覆盖
+
+    覆盖可以是 (starts, stops) 区间数组、单元格数组或单元格列表，
+    区间直接拼接（查找结果本身会去重），单元格去重。
+    """
+    if len(parts) == 1:
+        return parts[0]
+    first = parts[0]
+    if isinstance(first, tuple):
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+    if isinstance(first, np.ndarray):
+        return np.unique(np.concatenate(parts))
+    return list(dict.fromkeys(chain.from_iterable(parts)))
+
+
+class CoveringCache:
+    """查询覆盖的记忆化缓存
+
+    bbox 先向外对齐到 quantum 度的格网；对齐后超过 tile_size 的 bbox 再按
+    tile_size 的整数倍切分为对齐瓦片，逐个瓦片计算并缓存覆盖后合并。
+    相互重叠的查询即使 bbox 略有不同，也能共用内部瓦片的覆盖。
+    瓦片覆盖的并集包含原 bbox 的覆盖，候选集只会多不会少。
+    """
+
+    def __init__(self,
+                 quantum=1e-3,
+                 tile_size=None,
+                 max_entries=4096,
+                 max_tiles=64):
+        self.quantum = quantum
+        # 瓦片边长（度），None 表示不切分，只做对齐
+        self.tile_size = tile_size
+        self.max_entries = max_entries
+        # 单个查询最多切分的瓦片数，超过时整体计算一次，避免覆盖过碎
+        self.max_tiles = max_tiles
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def tiles(self, bbox):
+        """bbox 对齐并切分后的瓦片，以 quantum 为单位的整数坐标表示"""
+        q = self.quantum
+        min_x = math.floor(bbox[0] / q)
+        min_y = math.floor(bbox[1] / q)
+        max_x = max(math.ceil(bbox[2] / q), min_x + 1)
+        max_y = max(math.ceil(bbox[3] / q), min_y + 1)
+        if not self.tile_size:
+            return [(min_x, min_y, max_x, max_y)]
+
+        step = max(1, round(self.tile_size / q))
+        xs = range(min_x // step * step, max_x, step)
+        ys = range(min_y // step * step, max_y, step)
+        if len(xs) * len(ys) > self.max_tiles:
+            return [(min_x, min_y, max_x, max_y)]
+        # 边缘瓦片裁剪到对齐后的 bbox，内部瓦片为完整的对齐瓦片
+        return [(max(x, min_x), max(y, min_y), min(x + step, max_x),
+                 min(y + step, max_y)) for x in xs for y in ys]
+
+    def get(self, cover, bbox, resolution):
+        """返回 bbox 的覆盖：逐个瓦片查缓存，未命中的由 cover 计算"""
+        q = self.quantum
+        parts = []
+        for tile in self.tiles(bbox):
+            key = (cover.__name__, resolution, tile)
+            covering = self._entries.get(key)
+            if covering is None:
+                self.misses += 1
+                covering = cover(tuple(v * q for v in tile))
+                self._entries[key] = covering
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            parts.append(covering)
+        return merge_coverings(parts)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
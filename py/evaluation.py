@@ -0,0 +1,168 @@
+# evaluation.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import argparse
+import time
+
+import numpy as np
+import shapely
+
+from index_base import read_feature_bounds, read_geometries
+from benchmark import build_engines, make_bboxes, write_json, write_csv
+
+# 评估记录中的字段顺序（CSV 表头）
+FIELDS = [
+    'engine', 'resolution', 'bbox_size', 'queries', 'truth_level', 'truth',
+    'candidates', 'results', 'candidate_recall', 'result_recall',
+    'min_recall', 'missed_queries', 'missed_features', 'false_positive_ratio',
+    'result_precision', 'amplification', 'mean_ms'
+]
+
+
+class GroundTruth:
+    """由数据源直接计算的精确查询结果，与任何索引无关
+
+    外包矩形按 minx 排序，查询时先用二分查找截去 minx 超出 bbox 的部分，
+    再对其余要素做向量化相交比较。geometry 为 True 时再以几何相交判断，
+    对应 geometry_check 的查询语义。
+    """
+
+    def __init__(self, data_path, geometry=False, workers=1):
+        bounds = read_feature_bounds(data_path, workers)
+        order = np.argsort(bounds.minx, kind='stable')
+        self.fids = bounds.fids[order]
+        self.boxes = np.ascontiguousarray(bounds.boxes[:, order])
+        self.geometry = geometry
+        self.geometries = None
+        if geometry:
+            _, self.geometries = read_geometries(data_path, self.fids)
+
+    def __len__(self):
+        return len(self.fids)
+
+    def query(self, bbox):
+        """返回与 bbox 相交的全部 fid（升序）"""
+        min_x, min_y, max_x, max_y = bbox
+        boxes = self.boxes
+        n = np.searchsorted(boxes[0], max_x, side='right')
+        mask = ((boxes[2, :n] >= min_x) & (boxes[3, :n] >= min_y) &
+                (boxes[1, :n] <= max_y))
+        rows = np.flatnonzero(mask)
+        if self.geometry and len(rows):
+            rows = rows[shapely.intersects(shapely.box(*bbox),
+                                           self.geometries[rows])]
+        return np.sort(self.fids[rows])
+
+
+def evaluate(name, engine, truth, bboxes, bbox_size=None):
+    """以 GroundTruth 为准，统计一个引擎在一组 bbox 上的召回与误检
+
+    候选召回（candidate_recall）衡量索引本身是否漏掉真实结果；
+    结果召回（result_recall）为精确验证之后的召回，应为 1。
+    误检比例为候选中不属于真实结果的比例，放大系数为候选数 / 真实结果数，
+    二者决定精确验证的开销。比例均按整个查询集合汇总（微平均）。
+    """
+    exact_check = not truth.geometry
+    truth_total = candidate_total = result_total = 0
+    candidate_hits = result_hits = 0
+    min_recall = 1.0
+    missed_queries = 0
+    elapsed_ns = 0
+    for bbox in np.asarray(bboxes, dtype=np.float64).tolist():
+        expected = truth.query(bbox)
+        start = time.perf_counter_ns()
+        candidates, results = engine.query(bbox, exact_check, truth.geometry)
+        elapsed_ns += time.perf_counter_ns() - start
+
+        hits = np.count_nonzero(np.isin(expected, candidates))
+        truth_total += len(expected)
+        candidate_total += len(candidates)
+        result_total += len(results)
+        candidate_hits += hits
+        result_hits += np.count_nonzero(np.isin(expected, results))
+        if hits < len(expected):
+            missed_queries += 1
+            min_recall = min(min_recall, hits / len(expected))
+
+    queries = len(bboxes)
+    return {
+        'engine': name,
+        'resolution': engine.resolution,
+        'bbox_size': bbox_size,
+        'queries': queries,
+        'truth_level': 'geometry' if truth.geometry else 'bounds',
+        'truth': truth_total,
+        'candidates': candidate_total,
+        'results': result_total,
+        'candidate_recall':
+        candidate_hits / truth_total if truth_total else 1.0,
+        'result_recall': result_hits / truth_total if truth_total else 1.0,
+        'min_recall': min_recall,
+        'missed_queries': missed_queries,
+        'missed_features': truth_total - candidate_hits,
+        'false_positive_ratio':
+        (candidate_total - candidate_hits) / candidate_total
+        if candidate_total else 0.0,
+        'result_precision':
+        result_hits / result_total if result_total else 1.0,
+        'amplification':
+        candidate_total / truth_total if truth_total else 0.0,
+        'mean_ms': elapsed_ns / queries / 1e6 if queries else 0.0
+    }
+
+
+def evaluate_all(engines, truth, sizes, extent, count=100, seed=0):
+    """按 bbox 边长扫描，评估全部引擎，返回记录列表"""
+    records = []
+    for size in sizes:
+        bboxes = make_bboxes(extent, size, count, seed)
+        for name, engine in engines.items():
+            record = evaluate(name, engine, truth, bboxes, size)
+            records.append(record)
+            print(f"{name:>12} size={size:<8g} "
+                  f"recall={record['candidate_recall']:.4f} "
+                  f"(min {record['min_recall']:.4f}, "
+                  f"漏检 {record['missed_features']}) "
+                  f"误检比例={record['false_positive_ratio']:.3f} "
+                  f"放大={record['amplification']:.2f}x "
+                  f"{record['mean_ms']:.3f}ms")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="空间索引召回率与误检评估")
+    parser.add_argument('data', help="数据源路径")
+    parser.add_argument('--engines', default='Rtree,GeoHash,S2,H3')
+    parser.add_argument('--resolutions', default='',
+                        help="逗号分隔的分辨率，为空时使用各引擎默认值")
+    parser.add_argument('--index-dir', default='./index_py/bench')
+    parser.add_argument('--sizes', default='0.001,0.01,0.1',
+                        help="逗号分隔的 bbox 边长（度）")
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--geometry', action='store_true',
+                        help="以几何相交作为真实结果（默认为外包矩形相交）")
+    parser.add_argument('--json')
+    parser.add_argument('--csv')
+    args = parser.parse_args()
+
+    resolutions = [int(r) for r in args.resolutions.split(',') if r]
+    engines = build_engines(args.data, args.index_dir,
+                            args.engines.split(','), resolutions)
+    truth = GroundTruth(args.data, args.geometry)
+    boxes = truth.boxes
+    extent = (boxes[0].min(), boxes[1].min(), boxes[2].max(), boxes[3].max())
+    records = evaluate_all(engines, truth,
+                           [float(s) for s in args.sizes.split(',')], extent,
+                           args.count, args.seed)
+    if args.json:
+        write_json(records, args.json)
+    if args.csv:
+        write_csv(records, args.csv, FIELDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,51 +4,220 @@
 #   @date: 2025-07-23
 #
 
-import pygeohash as geohash
-from index_base import SpatialIndex
-import pickle
+from index_base import (SpatialIndex, pack_arrays, unpack_arrays,
+                        cover_bounds)
+from postings import (build_postings, postings_from_arrays, dict_to_csr,
+                      pairs_to_dict, merge_postings, check_storage)
+import numpy as np
 import os
 import time
 from collections import defaultdict
+from functools import partial
+from itertools import chain
 from osgeo import ogr
 
+BASE32 = np.frombuffer(b'0123456789bcdefghjkmnpqrstuvwxyz', dtype=np.uint8)
+# 字符 -> 5 位取值的查找表
+BASE32_VALUES = np.zeros(256, dtype=np.int64)
+BASE32_VALUES[BASE32] = np.arange(32)
 
-def bbox_to_geohashes(bbox, precision=6):
-    """计算一个bbox覆盖的geohash列表，步长基于精度自适应"""
+
+def geohash_bits(precision):
+    """返回给定精度下经度、纬度方向的比特数"""
+    total_bits = 5 * precision
+    return (total_bits + 1) // 2, total_bits // 2
+
+
+def bounds_to_cell_ranges(min_lon, min_lat, max_lon, max_lat, precision):
+    """计算外包矩形在 GeoHash 网格上覆盖的整数行列范围（闭区间）"""
+    lon_bits, lat_bits = geohash_bits(precision)
+    nx, ny = 1 << lon_bits, 1 << lat_bits
+
+    def to_cell(value, offset, span, n):
+        cell = np.floor((np.asarray(value, dtype=np.float64) + offset) /
+                        span * n)
+        return np.clip(cell, 0, n - 1).astype(np.int64)
+
+    return (to_cell(min_lon, 180.0, 360.0, nx),
+            to_cell(max_lon, 180.0, 360.0, nx),
+            to_cell(min_lat, 90.0, 180.0, ny),
+            to_cell(max_lat, 90.0, 180.0, ny))
+
+
+def encode_cells(ix, iy, precision):
+    """将网格行列号按 GeoHash 规则交错编码为整数（经度位在前）"""
+    lon_bits, lat_bits = geohash_bits(precision)
+    ix = np.asarray(ix, dtype=np.int64)
+    iy = np.asarray(iy, dtype=np.int64)
+    codes = np.zeros(np.broadcast(ix, iy).shape, dtype=np.int64)
+    for k in range(lon_bits + lat_bits):
+        if k % 2 == 0:
+            bit = (ix >> (lon_bits - 1 - k // 2)) & 1
+        else:
+            bit = (iy >> (lat_bits - 1 - k // 2)) & 1
+        codes = (codes << 1) | bit
+    return codes
+
+
+def decode_cells(codes, precision):
+    """encode_cells 的逆运算，返回网格行列号 (ix, iy)"""
+    lon_bits, lat_bits = geohash_bits(precision)
+    codes = np.asarray(codes, dtype=np.int64)
+    ix = np.zeros_like(codes)
+    iy = np.zeros_like(codes)
+    for k in range(lon_bits + lat_bits):
+        bit = (codes >> (lon_bits + lat_bits - 1 - k)) & 1
+        if k % 2 == 0:
+            ix = (ix << 1) | bit
+        else:
+            iy = (iy << 1) | bit
+    return ix, iy
+
+
+def codes_to_geohashes(codes, precision):
+    """将整数编码转换为 GeoHash 字符串列表"""
+    codes = np.asarray(codes, dtype=np.int64)
+    shifts = 5 * np.arange(precision - 1, -1, -1, dtype=np.int64)
+    chars = BASE32[(codes[:, None] >> shifts) & 31]
+    return np.ascontiguousarray(chars).view(
+        f'S{precision}').ravel().astype(str).tolist()
+
+
+def geohashes_to_codes(hashes, precision):
+    """codes_to_geohashes 的逆运算，hashes 须为同一精度"""
+    chars = np.array(hashes, dtype=f'S{precision}').view(np.uint8).reshape(
+        -1, precision)
+    shifts = 5 * np.arange(precision - 1, -1, -1, dtype=np.int64)
+    return (BASE32_VALUES[chars] << shifts).sum(axis=1)
+
+
+def bounds_to_geohash_codes(min_lon, min_lat, max_lon, max_lat, precision):
+    """批量计算外包矩形覆盖的 GeoHash 编码
+
+    返回 (rows, codes)：rows[i] 为 codes[i] 所属外包矩形的下标。
+    覆盖恰好是与外包矩形相交的全部网格，不依赖浮点步长扫描。
+    """
+    ix0, ix1, iy0, iy1 = bounds_to_cell_ranges(np.atleast_1d(min_lon),
+                                               np.atleast_1d(min_lat),
+                                               np.atleast_1d(max_lon),
+                                               np.atleast_1d(max_lat),
+                                               precision)
+    nx = ix1 - ix0 + 1
+    counts = nx * (iy1 - iy0 + 1)
+    rows = np.repeat(np.arange(len(counts)), counts)
+    local = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(
+        np.cumsum(counts) - counts, counts)
+    ix = ix0[rows] + local % nx[rows]
+    iy = iy0[rows] + local // nx[rows]
+    return rows, encode_cells(ix, iy, precision)
+
+
+def bounds_to_geohash_postings(bounds, precision):
+    """计算一块要素外包矩形覆盖的 GeoHash 编码，返回 (编码, fid) 数组"""
+    rows, codes = bounds_to_geohash_codes(bounds.minx, bounds.miny,
+                                          bounds.maxx, bounds.maxy, precision)
+    return codes, bounds.fids[rows]
+
+
+def bbox_to_geohash_ranges(bbox, precision, query_precision=None,
+                           max_cells=None):
+    """以混合精度前缀覆盖 bbox，返回精度 precision 编码空间中的区间
+
+    从 1 位精度开始逐级细分：完全落在 bbox 内的格网直接作为一个前缀输出，
+    与边界相交的格网继续细分，直到 query_precision（默认等于 precision），
+    或细分后的格网数将超过 max_cells 时提前停止（此时覆盖略大于 bbox）。
+    一个 q 位前缀对应精度 precision 下的连续编码区间
+    [code << 5(p-q), (code + 1) << 5(p-q))，相邻区间会被合并。
+    返回 (starts, stops)。
+    """
     min_lon, min_lat, max_lon, max_lat = bbox
-    step = {
-        5: 0.01,
-        6: 0.001,
-        7: 0.0005,
-        8: 0.00025,
-        9: 0.0001,
-        10: 0.00005,
-        11: 0.000025,
-        12: 0.00001
-    }.get(precision, 0.005)
-
-    lat = min_lat
-    geohashes = set()
-    while lat <= max_lat:
-        lon = min_lon
-        while lon <= max_lon:
-            h = geohash.encode(lat, lon, precision)
-            geohashes.add(h)
-            lon += step
-        lat += step
-    return list(geohashes)
+    query_precision = min(query_precision or precision, precision)
+
+    q = 1
+    ix0, ix1, iy0, iy1 = bounds_to_cell_ranges(min_lon, min_lat, max_lon,
+                                               max_lat, q)
+    ix, iy = np.meshgrid(np.arange(ix0, ix1 + 1), np.arange(iy0, iy1 + 1))
+    codes = encode_cells(ix.ravel(), iy.ravel(), q)
+
+    starts, stops = [], []
+    while True:
+        lon_bits, lat_bits = geohash_bits(q)
+        ix, iy = decode_cells(codes, q)
+        if q < query_precision:
+            width, height = 360.0 / (1 << lon_bits), 180.0 / (1 << lat_bits)
+            inside = ((ix * width - 180.0 >= min_lon) &
+                      ((ix + 1) * width - 180.0 <= max_lon) &
+                      (iy * height - 90.0 >= min_lat) &
+                      ((iy + 1) * height - 90.0 <= max_lat))
+        else:
+            inside = np.ones(len(codes), dtype=bool)
+
+        shift = 5 * (precision - q)
+        starts.append(codes[inside] << shift)
+        stops.append((codes[inside] + 1) << shift)
+        if q == query_precision:
+            break
+
+        # 边界格网细分为 32 个子格网，仅保留与 bbox 相交的部分
+        children = ((codes[~inside, None] << 5) |
+                    np.arange(32, dtype=np.int64)).ravel()
+        ix0, ix1, iy0, iy1 = bounds_to_cell_ranges(min_lon, min_lat, max_lon,
+                                                   max_lat, q + 1)
+        ix, iy = decode_cells(children, q + 1)
+        children = children[(ix >= ix0) & (ix <= ix1) & (iy >= iy0) &
+                            (iy <= iy1)]
+        if max_cells is not None and len(children) > max_cells:
+            starts.append(codes[~inside] << shift)
+            stops.append((codes[~inside] + 1) << shift)
+            break
+        codes = children
+        q += 1
+
+    starts = np.concatenate(starts)
+    stops = np.concatenate(stops)
+    order = np.argsort(starts)
+    starts, stops = starts[order], stops[order]
+
+    # 合并首尾相接的区间
+    new_run = np.ones(len(starts), dtype=bool)
+    new_run[1:] = starts[1:] != stops[:-1]
+    run_ids = np.cumsum(new_run) - 1
+    merged_stops = np.empty(int(new_run.sum()), dtype=np.int64)
+    merged_stops[run_ids] = stops
+    return starts[new_run], merged_stops
+
+
+def bbox_to_geohashes(bbox, precision=6):
+    """计算一个bbox覆盖的geohash列表"""
+    _, codes = bounds_to_geohash_codes(*bbox, precision)
+    return codes_to_geohashes(codes, precision)
 
 
 class GeoHashSpatialIndex(SpatialIndex):
 
+    ENGINE = 'geohash'
+
     def __init__(self,
                  data_path,
-                 index_file='./index_py/geohash.pkl',
-                 precision=6):
-        super().__init__(data_path, index_file, precision)
+                 index_file='./index_py/geohash.spx',
+                 precision=6,
+                 storage='dict',
+                 query_precision=None,
+                 max_query_cells=1024,
+                 compression=None,
+                 workers=1):
+        super().__init__(data_path, index_file, precision, workers)
+        check_storage(storage, compression)
+        # dict: GeoHash 字符串 -> fid 列表；
+        # sorted: 按整数编码排序的 (code, fid) 数组，支持前缀区间查找
+        # csr: 同样以整数编码为键，倒排表为 CSR 结构，可选 varint 压缩
+        self.storage = storage
+        self.compression = compression
+        # 数组存储下查询覆盖细分到的最高精度，默认等于建索引精度
+        self.query_precision = query_precision
+        # 数组存储下单次细分允许的最大格网数，超过后以较粗前缀覆盖边界
+        self.max_query_cells = max_query_cells
         self.geohash_index = defaultdict(list)
-        self.feature_bounds = {}  # 存储要素的外包矩形用于精确验证
-        self.feature_count = 0  # 要素总数
 
         ogr.RegisterAll()
 
@@ -58,36 +227,29 @@ class GeoHashSpatialIndex(SpatialIndex):
         else:
             print("GeoHash 索引文件不存在，请调用 build_index() 构建索引")
 
-    def build_index(self):
-        """构建或重建 GeoHash 空间索引"""
+    def _build_from_bounds(self, bounds):
+        """由已提取的外包矩形构建或重建 GeoHash 空间索引"""
         start_time = time.time()
 
-        datasource = ogr.Open(self.data_path)
-        layer = datasource.GetLayer()
-        self.feature_count = layer.GetFeatureCount()
+        self.feature_bounds = bounds
+        self.feature_count = len(self.feature_bounds)
         print(f"开始构建 GeoHash 索引，共 {self.feature_count} 个要素...")
 
-        self.geohash_index.clear()
-        feature_bounds = []
-
-        for feature in layer:
-            fid = feature.GetFID()
-            geom = feature.GetGeometryRef()
-            if not geom:
-                continue
-
-            # 获取外包矩形
-            env = geom.GetEnvelope()
-            min_lon, max_lon, min_lat, max_lat = env
-            bounds = (min_lon, min_lat, max_lon, max_lat)
-            self.feature_bounds[fid] = bounds
-            feature_bounds.append((fid, bounds))
-
-            # 计算覆盖的 GeoHash 列表
-            covering_hashes = bbox_to_geohashes(bounds, self.resolution)
-
-            for h in covering_hashes:
-                self.geohash_index[h].append(fid)
+        # 向量化计算要素覆盖的 GeoHash 编码，workers > 1 时分块并行
+        codes, fids = cover_bounds(
+            partial(bounds_to_geohash_postings, precision=self.resolution),
+            self.feature_bounds, self.workers, self.pool)
+        if self.storage != 'dict':
+            self.geohash_index = build_postings(self.storage,
+                                                codes,
+                                                fids,
+                                                compression=self.compression)
+        else:
+            self.geohash_index = pairs_to_dict(
+                codes,
+                fids,
+                key_func=lambda keys: codes_to_geohashes(
+                    keys, self.resolution))
 
         # 保存 GeoHash 索引
         self.save_index()
@@ -95,39 +257,78 @@ class GeoHashSpatialIndex(SpatialIndex):
         print(f"索引构建完成! 耗时: {time.time() - start_time:.2f}秒")
         print(f"GeoHash索引条目: {len(self.geohash_index)}")
 
-    def query_by_bbox(self, bbox):
-        """基于 BBox 查询要素"""
-        start_time = time.time()
-        # 计算查询区域的 GeoHash 列表
-        query_hashes = bbox_to_geohashes(bbox, self.resolution)
+    def _query_ranges(self, bbox):
+        """计算查询区域的 GeoHash 编码查找区间"""
+        return bbox_to_geohash_ranges(bbox, self.resolution,
+                                      self.query_precision,
+                                      self.max_query_cells)
+
+    def _query_hashes(self, bbox):
+        """计算查询区域的 GeoHash 列表"""
+        return bbox_to_geohashes(bbox, self.resolution)
+
+    def _query_candidates(self, bbox):
+        """由 GeoHash 编码获取候选要素"""
+        if self.storage != 'dict':
+            starts, stops = self._covering(self._query_ranges, bbox)
+            return self.geohash_index.lookup_ranges(starts, stops)
+
+        query_hashes = self._covering(self._query_hashes, bbox)
         candidate_fids = set()
         for h in query_hashes:
             candidate_fids.update(self.geohash_index.get(h, []))
 
-        candidate_fids = list(candidate_fids)
+        return np.fromiter(candidate_fids,
+                           dtype=np.int64,
+                           count=len(candidate_fids))
 
-        # 精确几何验证
-        results = candidate_fids
-        duration = (time.time() - start_time) * 1000
-        print(f"查询完成! 耗时: {duration:.2f}ms")  # 占位，实际由测试类统计
-        print(f"候选要素: {len(candidate_fids)}")
-        return results
+    def _query_candidates_batch(self, bboxes):
+        """先计算全部查询的覆盖编码，再统一合并倒排表"""
+        if not len(bboxes):
+            return np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if self.storage != 'dict':
+            return self._lookup_ranges_batch(self.geohash_index,
+                                             self._query_ranges, bboxes)
 
-    def load_index(self):
-        """从pickle文件加载GeoHash索引"""
-        with open(self.index_file, 'rb') as f:
-            loaded_data = pickle.load(f)
-            if isinstance(loaded_data, dict):
-                self.geohash_index = loaded_data
-            else:
-                raise ValueError("加载的GeoHash索引格式不正确")
+        coverings = [
+            self._covering(self._query_hashes, bbox)
+            for bbox in bboxes.tolist()
+        ]
+        query_ids = np.repeat(np.arange(len(coverings)),
+                              [len(hashes) for hashes in coverings])
+        hashes = np.array(list(chain.from_iterable(coverings)), dtype=str)
+        return merge_postings(self.geohash_index, query_ids, hashes,
+                              len(bboxes))
 
+    def _index_meta(self):
+        return {'storage': self.storage, 'compression': self.compression}
+
+    def _index_arrays(self):
+        if self.storage != 'dict':
+            return pack_arrays('postings', self.geohash_index.to_arrays())
+        # 字典存储的 GeoHash 字符串转为整数编码后以 CSR 数组写入
+        keys = geohashes_to_codes(list(self.geohash_index), self.resolution)
+        return pack_arrays('postings',
+                           dict_to_csr(self.geohash_index, keys).to_arrays())
+
+    def _restore_index(self, meta, arrays):
+        self.storage = meta['storage']
+        self.compression = meta['compression']
+        postings = postings_from_arrays(
+            'csr' if self.storage == 'dict' else self.storage,
+            unpack_arrays(arrays, 'postings'))
+        if self.storage != 'dict':
+            self.geohash_index = postings
+        else:
+            keys = codes_to_geohashes(postings.keys, self.resolution)
+            self.geohash_index = defaultdict(list, postings.to_dict(keys))
+
+    def load_index(self):
+        """从索引文件加载GeoHash索引（内存映射）"""
+        self.read_index()
         print("GeoHash索引加载完成")
 
     def save_index(self):
-        """将GeoHash索引保存为pickle文件"""
-        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
-        with open(self.index_file, 'wb') as f:
-            pickle.dump(dict(self.geohash_index), f)
-
+        """将GeoHash索引与外包矩形写入索引文件"""
+        self.write_index()
         print("GeoHash索引保存完成")
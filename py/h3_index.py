@@ -4,26 +4,108 @@
 #   @date: 2025-07-23
 #
 
-from h3 import geo_to_cells
-from index_base import SpatialIndex
-import pickle
+from h3 import str_to_int, int_to_str
+import h3.api.numpy_int as h3_int
+from index_base import (SpatialIndex, pack_arrays, unpack_arrays,
+                        cover_bounds)
+from postings import (build_postings, postings_from_arrays, dict_to_csr,
+                      pairs_to_dict, merge_postings, check_storage)
+import numpy as np
 import os
 import time
 from collections import defaultdict
+from functools import partial
+from itertools import chain
 from shapely.geometry import box
 from osgeo import ogr
 
 
+H3_RES_SHIFT = 52
+
+
+def cell_parents(cells, res):
+    """向量化计算 uint64 单元格在分辨率 res 下的父单元格
+
+    H3 索引的 52-55 位为分辨率，其后每 3 位一个层级数字；
+    父单元格即改写分辨率字段，并把更细层级的数字全部置为 7。
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    parents = cells & ~np.uint64(0xF << H3_RES_SHIFT)
+    parents |= np.uint64(res << H3_RES_SHIFT)
+    return parents | np.uint64((1 << ((15 - res) * 3)) - 1)
+
+
+def cell_resolutions(cells):
+    """向量化读取 uint64 单元格的分辨率"""
+    cells = np.asarray(cells, dtype=np.uint64)
+    return ((cells >> np.uint64(H3_RES_SHIFT)) & np.uint64(0xF)).astype(
+        np.int64)
+
+
+def bbox_to_cells(bbox, resolution, contain='overlap'):
+    """计算矩形的 uint64 H3 覆盖
+
+    center 只取中心点落在矩形内的单元格，小于单元格的矩形（含点要素）
+    可能没有任何单元格；overlap 取与矩形相交的全部单元格，要素与查询的
+    外包矩形相交时二者的覆盖必有公共单元格，不会漏检。
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if contain == 'center':
+        return h3_int.geo_to_cells(box(min_lon, min_lat, max_lon, max_lat),
+                                   resolution)
+    shape = h3_int.LatLngPoly([(min_lat, min_lon), (min_lat, max_lon),
+                               (max_lat, max_lon), (max_lat, min_lon)])
+    return h3_int.h3shape_to_cells_experimental(shape, resolution, contain)
+
+
+def bounds_to_h3_cells(bounds, resolution, compact=False, contain='overlap'):
+    """计算一块要素外包矩形的 H3 覆盖，返回 (uint64 单元格, fid) 数组"""
+    cell_arrays, fid_arrays = [], []
+    for fid, *bbox in bounds.iter_rows():
+        cells = bbox_to_cells(bbox, resolution, contain)
+        if compact:
+            cells = h3_int.compact_cells(cells)
+        cell_arrays.append(cells)
+        fid_arrays.append(np.full(len(cells), fid, dtype=np.int64))
+
+    keys = np.concatenate(cell_arrays).astype(np.uint64, copy=False) \
+        if cell_arrays else np.empty(0, dtype=np.uint64)
+    fids = np.concatenate(fid_arrays) if fid_arrays else np.empty(
+        0, dtype=np.int64)
+    return keys, fids
+
+
 class H3SpatialIndex(SpatialIndex):
 
+    ENGINE = 'h3'
+
     def __init__(self,
                  data_path,
-                 index_file='./index_py/h3.pkl',
-                 resolution=9):
-        super().__init__(data_path, index_file, resolution)
+                 index_file='./index_py/h3.spx',
+                 resolution=9,
+                 compact=False,
+                 storage='dict',
+                 compression=None,
+                 contain='overlap',
+                 workers=1):
+        super().__init__(data_path, index_file, resolution, workers)
+        check_storage(storage, compression)
+        if contain not in ('center', 'overlap', 'bbox_overlap'):
+            raise ValueError(f"不支持的覆盖方式: {contain}")
+        # dict: H3 字符串 -> fid 列表；
+        # sorted: 全程使用 h3 的 numpy 整数接口，单元格以 uint64 排序数组保存
+        # csr: 同样使用整数接口，倒排表为 CSR 结构，可选 varint 压缩
+        self.storage = storage
+        self.compression = compression
         self.h3_index = defaultdict(list)
-        self.feature_bounds = {}  # 存储要素的外包矩形用于精确验证
-        self.feature_count = 0  # 要素总数
+        # compact 为 True 时每个要素只保存 compact_cells 之后的单元格，
+        # 查询时再沿父单元格链向上匹配
+        self.compact = compact
+        # 索引中出现的单元格分辨率，仅 compact 模式下需要查找父单元格
+        self.index_resolutions = [resolution]
+        # 矩形覆盖方式，构建与查询使用同一种：center 为 H3 默认的中心点
+        # 判定（会漏掉小要素），overlap/bbox_overlap 取相交的全部单元格
+        self.contain = contain
 
         ogr.RegisterAll()
 
@@ -33,39 +115,37 @@ class H3SpatialIndex(SpatialIndex):
         else:
             print("H3 索引文件不存在，请调用 build_index() 构建索引")
 
-    def build_index(self):
-        """构建或重建 H3 空间索引"""
+    def _build_from_bounds(self, bounds):
+        """由已提取的外包矩形构建或重建 H3 空间索引"""
         start_time = time.time()
 
-        datasource = ogr.Open(self.data_path)
-        layer = datasource.GetLayer()
-        self.feature_count = layer.GetFeatureCount()
+        self.feature_bounds = bounds
+        self.feature_count = len(self.feature_bounds)
         print(f"开始构建 H3 索引，共 {self.feature_count} 个要素...")
 
-        self.h3_index.clear()
-        feature_bounds = []
-
-        for feature in layer:
-            fid = feature.GetFID()
-            geom = feature.GetGeometryRef()
-            if not geom:
-                continue
-
-            # 获取外包矩形
-            env = geom.GetEnvelope()
-            min_lon, max_lon, min_lat, max_lat = env
-            bounds = (min_lon, min_lat, max_lon, max_lat)
-            self.feature_bounds[fid] = bounds
-            feature_bounds.append((fid, bounds))
-
-            # 构建查询区域（使用外包矩形）
-            polygon = box(min_lon, min_lat, max_lon, max_lat)
-
-            # 获取覆盖这个区域的 H3 单元格
-            coverer = geo_to_cells(polygon, self.resolution)
-
-            for cell in coverer:
-                self.h3_index[cell].append(fid)
+        # 各进程分块计算 uint64 单元格覆盖，在主进程合并
+        keys, fids = cover_bounds(
+            partial(bounds_to_h3_cells,
+                    resolution=self.resolution,
+                    compact=self.compact,
+                    contain=self.contain), self.feature_bounds,
+            self.workers, self.pool)
+        if self.storage != 'dict':
+            self.h3_index = build_postings(self.storage,
+                                           keys,
+                                           fids,
+                                           key_dtype=np.uint64,
+                                           compression=self.compression)
+        else:
+            # 字典以 H3 字符串为键
+            self.h3_index = pairs_to_dict(
+                keys,
+                fids,
+                key_dtype=np.uint64,
+                key_func=lambda cells: [int_to_str(c) for c in cells.tolist()])
+        self.index_resolutions = np.unique(
+            cell_resolutions(keys)).tolist() \
+            if self.compact else [self.resolution]
 
         # 保存 H3 索引
         self.save_index()
@@ -73,42 +153,102 @@ class H3SpatialIndex(SpatialIndex):
         print(f"索引构建完成! 耗时: {time.time() - start_time:.2f}秒")
         print(f"H3索引条目: {len(self.h3_index)}")
 
-    def query_by_bbox(self, bbox):
-        """基于 BBox 查询要素"""
-        start_time = time.time()
-        min_lon, min_lat, max_lon, max_lat = bbox
+    def _query_cells(self, bbox):
+        """计算查询区域的 H3 单元格列表（含 compact 模式下的父单元格）"""
+        cells = self._query_int_cells(bbox)
+        return [int_to_str(cell) for cell in cells.tolist()]
+
+    def _query_int_cells(self, bbox):
+        """计算查询区域的 uint64 单元格（含 compact 模式下的父单元格）"""
+        cells = bbox_to_cells(bbox, self.resolution, self.contain)
+        if not self.compact:
+            return cells
+
+        # compact 索引中的粗单元格是查询单元格的祖先，逐级补充父单元格
+        parents = [
+            cell_parents(cells, res) for res in self.index_resolutions
+            if res < self.resolution
+        ]
+        return np.unique(np.concatenate([cells] + parents))
+
+    def _query_candidates(self, bbox):
+        """由 H3 单元格获取候选要素"""
+        if self.storage != 'dict':
+            cells = self._covering(self._query_int_cells, bbox)
+            return self.h3_index.lookup_ranges(cells, cells + np.uint64(1))
 
-        # 构建查询区域的 H3 单元格
-        polygon = box(min_lon, min_lat, max_lon, max_lat)
-        coverer = geo_to_cells(polygon, self.resolution)
         candidate_fids = set()
-        for cell in coverer:
+        for cell in self._covering(self._query_cells, bbox):
             candidate_fids.update(self.h3_index.get(cell, []))
 
-        candidate_fids = list(candidate_fids)
-
-        results = candidate_fids
-
-        duration = (time.time() - start_time) * 1000
-        print(f"查询完成! 耗时: {duration:.2f}ms")  # 占位，实际由测试类统计
-        print(f"候选要素: {len(candidate_fids)}")
-        return results
+        return np.fromiter(candidate_fids,
+                           dtype=np.int64,
+                           count=len(candidate_fids))
+
+    def _query_candidates_batch(self, bboxes):
+        """先计算全部查询的覆盖单元格，再统一合并倒排表"""
+        if not len(bboxes):
+            return np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if self.storage != 'dict':
+            coverings = [
+                self._covering(self._query_int_cells, bbox)
+                for bbox in bboxes.tolist()
+            ]
+            query_ids = np.repeat(np.arange(len(coverings)),
+                                  [len(cells) for cells in coverings])
+            cells = np.concatenate(coverings).astype(np.uint64, copy=False)
+            return self.h3_index.lookup_ranges_batch(query_ids, cells,
+                                                     cells + np.uint64(1),
+                                                     len(bboxes))
+
+        coverings = [
+            self._covering(self._query_cells, bbox)
+            for bbox in bboxes.tolist()
+        ]
+        query_ids = np.repeat(np.arange(len(coverings)),
+                              [len(cells) for cells in coverings])
+        cells = np.array(list(chain.from_iterable(coverings)), dtype=str)
+        return merge_postings(self.h3_index, query_ids, cells, len(bboxes))
+
+    def _index_meta(self):
+        return {
+            'storage': self.storage,
+            'compression': self.compression,
+            'compact': self.compact,
+            'index_resolutions': self.index_resolutions,
+            'contain': self.contain
+        }
+
+    def _index_arrays(self):
+        if self.storage != 'dict':
+            return pack_arrays('postings', self.h3_index.to_arrays())
+        # 字典存储的 H3 字符串转为整数后以 CSR 数组写入
+        keys = [str_to_int(cell) for cell in self.h3_index]
+        return pack_arrays(
+            'postings',
+            dict_to_csr(self.h3_index, keys, key_dtype=np.uint64).to_arrays())
+
+    def _restore_index(self, meta, arrays):
+        self.storage = meta['storage']
+        self.compression = meta['compression']
+        self.compact = meta['compact']
+        self.index_resolutions = meta['index_resolutions']
+        self.contain = meta['contain']
+        postings = postings_from_arrays(
+            'csr' if self.storage == 'dict' else self.storage,
+            unpack_arrays(arrays, 'postings'))
+        if self.storage != 'dict':
+            self.h3_index = postings
+        else:
+            keys = [int_to_str(cell) for cell in postings.keys.tolist()]
+            self.h3_index = defaultdict(list, postings.to_dict(keys))
 
     def load_index(self):
-        """从pickle文件加载H3索引"""
-        with open(self.index_file, 'rb') as f:
-            loaded_data = pickle.load(f)
-            if isinstance(loaded_data, dict):
-                self.h3_index = loaded_data
-            else:
-                raise ValueError("加载的H3索引格式不正确")
-
+        """从索引文件加载H3索引（内存映射）"""
+        self.read_index()
         print("H3索引加载完成")
 
     def save_index(self):
-        """将H3索引保存为pickle文件"""
-        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
-        with open(self.index_file, 'wb') as f:
-            pickle.dump(dict(self.h3_index), f)
-
+        """将H3索引与外包矩形写入索引文件"""
+        self.write_index()
         print("H3索引保存完成")
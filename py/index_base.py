@@ -4,24 +4,944 @@
 #   @date: 2025-07-23
 #
 
+import os
+from multiprocessing import (get_all_start_methods, get_context,
+                             resource_tracker, shared_memory)
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import shapely
+from pyogrio import read_info
+from pyogrio.errors import FeatureError
+from pyogrio.raw import read as read_raw
+from index_file import (open_index_file, write_index_file, read_index_buffer,
+                        write_index_buffer, index_buffer_size)
+from postings import group_unique
+from query_cache import QueryCache
+from covering_cache import CoveringCache
+from instrumentation import QueryTrace, CallbackSink
+
+
+class FeatureBounds:
+    """要素外包矩形的列式存储
+
+    fids 为 int64 数组（升序），boxes 为 (4, N) 的 float64 数组，
+    四行依次为 minx、miny、maxx、maxy，每一列即一个要素的外包矩形。
+    """
+
+    def __init__(self, fids=None, boxes=None):
+        if fids is None:
+            fids = np.empty(0, dtype=np.int64)
+            boxes = np.empty((4, 0), dtype=np.float64)
+        self.fids = fids
+        self.boxes = boxes
+
+    @classmethod
+    def from_columns(cls, fids, minx, miny, maxx, maxy):
+        """由各列数据构建，按 fid 排序"""
+        fids = np.asarray(fids, dtype=np.int64)
+        boxes = np.vstack([
+            np.asarray(minx, dtype=np.float64),
+            np.asarray(miny, dtype=np.float64),
+            np.asarray(maxx, dtype=np.float64),
+            np.asarray(maxy, dtype=np.float64)
+        ])
+        if len(fids) > 1 and np.any(fids[1:] < fids[:-1]):
+            order = np.argsort(fids, kind='stable')
+            fids = fids[order]
+            boxes = boxes[:, order]
+        return cls(fids, np.ascontiguousarray(boxes))
+
+    @classmethod
+    def concat(cls, parts):
+        """按顺序拼接若干块，再整体按 fid 排序"""
+        parts = list(parts)
+        if not parts:
+            return cls()
+        return cls.from_columns(np.concatenate([p.fids for p in parts]),
+                                *np.hstack([p.boxes for p in parts]))
+
+    def split(self, n_chunks):
+        """按行均分为 n_chunks 块（各块为连续的副本，便于传给子进程）"""
+        edges = np.linspace(0, len(self), n_chunks + 1).astype(np.int64)
+        return [
+            FeatureBounds(np.ascontiguousarray(self.fids[a:b]),
+                          np.ascontiguousarray(self.boxes[:, a:b]))
+            for a, b in zip(edges[:-1], edges[1:])
+        ]
+
+    def drop(self, fids):
+        """返回去掉给定 fid 后的新 FeatureBounds"""
+        keep = ~np.isin(self.fids, fids)
+        return FeatureBounds(self.fids[keep], self.boxes[:, keep])
+
+    def upsert(self, other):
+        """返回以 other 中的外包矩形覆盖或补充后的新 FeatureBounds"""
+        return FeatureBounds.concat([self.drop(other.fids), other])
+
+    def query_pairs(self, bboxes):
+        """两两比较全部 bbox 与全部外包矩形，返回相交的 (查询号, fid)
+
+        比较量为 bbox 数 × 要素数，只适用于增量层这类小规模的外包矩形。
+        """
+        b = np.asarray(bboxes, dtype=np.float64).reshape(-1, 1, 4)
+        boxes = self.boxes
+        hits = ((boxes[2] >= b[..., 0]) & (boxes[0] <= b[..., 2]) &
+                (boxes[3] >= b[..., 1]) & (boxes[1] <= b[..., 3]))
+        query_ids, rows = np.nonzero(hits)
+        return query_ids, self.fids[rows]
+
+    @property
+    def minx(self):
+        return self.boxes[0]
+
+    @property
+    def miny(self):
+        return self.boxes[1]
+
+    @property
+    def maxx(self):
+        return self.boxes[2]
+
+    @property
+    def maxy(self):
+        return self.boxes[3]
+
+    def __len__(self):
+        return len(self.fids)
+
+    def iter_rows(self):
+        """逐要素迭代 (fid, minx, miny, maxx, maxy)"""
+        return zip(self.fids.tolist(), *self.boxes.tolist())
+
+    def lookup(self, fids):
+        """返回给定 fid 在存储中的行号，不存在的 fid 对应 -1"""
+        fids = np.asarray(fids, dtype=np.int64)
+        if len(self.fids) == 0:
+            return np.full(len(fids), -1, dtype=np.int64)
+        rows = np.searchsorted(self.fids, fids)
+        rows[rows >= len(self.fids)] = 0
+        return np.where(self.fids[rows] == fids, rows, -1)
+
+    def intersects(self, fids, bboxes):
+        """逐个判断 fid 的外包矩形是否与对应的 bbox 相交
+
+        bboxes 可以是单个 bbox，也可以是与 fids 等长的 (N, 4) 数组；
+        不存在的 fid 判为不相交。
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64)
+        if not len(self):
+            return np.zeros(len(fids), dtype=bool)
+        rows = self.lookup(fids)
+        known = rows >= 0
+        rows = np.where(known, rows, 0)
+        boxes = self.boxes
+        return known & ((boxes[2, rows] >= bboxes[..., 0]) &
+                        (boxes[0, rows] <= bboxes[..., 2]) &
+                        (boxes[3, rows] >= bboxes[..., 1]) &
+                        (boxes[1, rows] <= bboxes[..., 3]))
+
+    def filter_bbox(self, fids, bbox):
+        """筛选外包矩形与 bbox 相交的 fid（向量化比较）"""
+        fids = np.asarray(fids, dtype=np.int64)
+        if not len(self):
+            return fids[:0]
+        return fids[self.intersects(fids, bbox)]
+
+
+def resolve_workers(workers):
+    """进程数：None 表示使用全部 CPU 核心"""
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def process_pool(workers):
+    """创建进程池，子进程以 forkserver（不支持时为 spawn）方式启动
+
+    并发构建时主进程中有多个线程，fork 会复制其他线程持有的锁，可能死锁。
+    子进程会重新导入主模块，调用脚本需有 if __name__ == "__main__" 保护。
+    """
+    method = 'forkserver' if 'forkserver' in get_all_start_methods() \
+        else 'spawn'
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=get_context(method))
+
+
+def map_chunks(func, chunks, workers, pool=None):
+    """workers > 1 时以进程池并行处理各块，结果保持块的顺序
+
+    pool 为调用方共用的进程池（见 IndexBuilder.build），给出时各块总在
+    其中计算。
+    """
+    if pool is not None:
+        return list(pool.map(func, chunks))
+    if workers <= 1 or len(chunks) <= 1:
+        return [func(chunk) for chunk in chunks]
+    with process_pool(min(workers, len(chunks))) as pool:
+        return list(pool.map(func, chunks))
+
+
+def count_features(data_path):
+    """图层要素数（驱动无法直接给出时强制计数）"""
+    return read_info(data_path, force_feature_count=True)['features']
+
+
+def _read_bounds_batch(data_path, start, count):
+    """读取第 [start, start + count) 个要素的 fid 与 WKB，向量化计算外包矩形"""
+    _, fids, wkb, _ = read_raw(data_path,
+                               columns=[],
+                               skip_features=start,
+                               max_features=count,
+                               return_fids=True)
+    boxes = shapely.bounds(shapely.from_wkb(wkb))
+    # 空几何的外包矩形为 NaN，与缺失几何一样跳过
+    valid = ~np.isnan(boxes).any(axis=1)
+    return FeatureBounds.from_columns(fids[valid], *boxes[valid].T)
+
+
+def _scan_bounds(data_path, start=0, stop=None, batch_size=65536):
+    """分批读取数据源第 [start, stop) 个要素，提取外包矩形"""
+    if stop is None:
+        stop = count_features(data_path)
+    return FeatureBounds.concat(
+        _read_bounds_batch(data_path, offset, min(batch_size, stop - offset))
+        for offset in range(start, stop, batch_size))
+
+
+def _scan_bounds_range(data_path, feature_range, batch_size=65536):
+    return _scan_bounds(data_path, *feature_range, batch_size=batch_size)
+
+
+def read_feature_bounds(data_path, workers=1, batch_size=65536):
+    """扫描数据源，提取所有要素的外包矩形
+
+    经 pyogrio 按批读取 fid 与几何 WKB（每批 batch_size 个要素，不读属性），
+    外包矩形由 shapely.bounds 向量化计算，不再逐要素经 OGR 取 Envelope。
+    workers > 1 时按要素序号把图层划分为若干连续区间（Shapefile 中即 FID
+    区间），每个子进程打开自己的数据源并读取其中一段。
+    """
+    feature_count = count_features(data_path)
+    if workers <= 1:
+        return _scan_bounds(data_path, 0, feature_count, batch_size)
+
+    # 每个进程分几段，避免个别区间几何较复杂时拖慢整体
+    edges = np.linspace(0, feature_count,
+                        workers * 4 + 1).astype(np.int64).tolist()
+    ranges = [(a, b) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+    parts = map_chunks(
+        partial(_scan_bounds_range, data_path, batch_size=batch_size), ranges,
+        workers)
+    return FeatureBounds.concat(parts)
+
+
+def cover_bounds(cover, bounds, workers=1, pool=None):
+    """分块计算全部要素的覆盖，返回拼接后的 (keys, fids)
+
+    cover 为模块级函数（可被子进程序列化），输入一块 FeatureBounds，
+    返回该块的 (keys, fids) 数组；workers > 1 时各块在进程池中并行计算，
+    给出共用的进程池 pool 时在其中计算。
+    """
+    chunks = bounds.split(workers * 4 if workers > 1 else 1)
+    parts = map_chunks(cover, chunks, workers, pool)
+    return (np.concatenate([keys for keys, _ in parts]),
+            np.concatenate([fids for _, fids in parts]))
+
+
+def dataset_fingerprint(data_path):
+    """数据源指纹：路径、文件大小、修改时间与要素数
+
+    目录形式的数据源（FileGDB、Shapefile 目录）的大小为其中全部文件大小
+    之和，修改时间取其中最晚的一个。
+    """
+    fingerprint = {
+        'path': os.path.abspath(data_path),
+        'size': None,
+        'mtime_ns': None,
+        'feature_count': count_features(data_path)
+    }
+    if os.path.isfile(data_path):
+        stat = os.stat(data_path)
+        fingerprint['size'] = stat.st_size
+        fingerprint['mtime_ns'] = stat.st_mtime_ns
+    elif os.path.isdir(data_path):
+        stats = [
+            os.stat(os.path.join(root, name))
+            for root, _, names in os.walk(data_path) for name in names
+        ]
+        fingerprint['size'] = sum(stat.st_size for stat in stats)
+        fingerprint['mtime_ns'] = max((stat.st_mtime_ns for stat in stats),
+                                      default=None)
+    return fingerprint
+
+
+def pack_arrays(prefix, arrays):
+    """为数组名加上段前缀，如 keys -> postings.keys"""
+    return {f'{prefix}.{name}': arr for name, arr in arrays.items()}
+
+
+def unpack_arrays(arrays, prefix):
+    """取出带某段前缀的数组并去掉前缀"""
+    head = prefix + '.'
+    return {
+        name[len(head):]: arr
+        for name, arr in arrays.items() if name.startswith(head)
+    }
+
+
+def _read_wkb(data_path, fids):
+    """按 fid 读取 WKB 列表，数据源中不存在的 fid 对应 None
+
+    整批读取遇到不存在的 fid 时对半拆分后分别重试，只有包含缺失 fid 的
+    部分会被重新读取。
+    """
+    try:
+        _, _, wkb, _ = read_raw(data_path, columns=[], fids=fids)
+        return list(wkb)
+    except FeatureError:
+        if len(fids) == 1:
+            return [None]
+        mid = len(fids) // 2
+        return (_read_wkb(data_path, fids[:mid]) +
+                _read_wkb(data_path, fids[mid:]))
+
+
+def read_geometries(data_path, fids):
+    """按 fid 批量读取要素几何（WKB），返回 (fids, shapely 几何数组)
+
+    返回的几何与输入 fid 顺序一一对应。数据源中已不存在的 fid（如尚未写回
+    数据源的 insert()、已被删除的要素）几何为 None，与任何范围都不相交。
+    """
+    fids = np.asarray(fids, dtype=np.int64)
+    if not len(fids):
+        return fids, np.empty(0, dtype=object)
+    return fids, shapely.from_wkb(_read_wkb(data_path, fids))
 
 
 class SpatialIndex(ABC):
 
-    def __init__(self, data_path, index_file, resolution):
+    # 索引文件头部中的引擎名，加载时据此校验文件类型
+    ENGINE = None
+
+    def __init__(self, data_path, index_file, resolution, workers=1):
         self.data_path = data_path
         self.index_file = index_file
         self.resolution = resolution
-        self.feature_bounds = {}
+        # 构建索引时使用的进程数，None 表示使用全部 CPU 核心
+        self.workers = resolve_workers(workers)
+        # 计算覆盖的共用进程池，仅在 IndexBuilder 并发构建期间不为 None
+        self.pool = None
+        self.feature_bounds = FeatureBounds()
         self.feature_count = 0
+        # 构建（或最近一次增量同步）时的数据源指纹
+        self.fingerprint = None
+        # 增量层：新增/更新要素的外包矩形，以及主索引中已失效条目的 fid
+        # （删除或更新过的要素），查询时与主索引的结果合并
+        self.delta_bounds = FeatureBounds()
+        self.tombstones = np.empty(0, dtype=np.int64)
+        # 查询时增量层与每个 bbox 逐条比较，refresh() 在增量层条目数超过
+        # max_delta 或主索引条目数的 max_delta_ratio 时把它并入主索引
+        self.max_delta = 10000
+        self.max_delta_ratio = 0.05
+        # 查询候选结果缓存，默认关闭，见 enable_cache()
+        self.query_cache = None
+        # 查询覆盖缓存，默认关闭，见 enable_covering_cache()
+        self.covering_cache = None
+        # attach_shared() 挂载的共享内存
+        self._shared_memory = None
+        # 查询分阶段记录的输出，默认关闭，见 instrument()
+        self.instrumentation = None
+        # 正在记录的查询，仅在开启记录的查询执行期间不为 None
+        self._trace = None
+
+    @property
+    def file_prefix(self):
+        """附属文件（如 R 树的 .dat/.idx）的前缀，与索引文件放在一起"""
+        return os.path.splitext(self.index_file)[0]
+
+    def _index_contents(self):
+        """索引文件的头部与数组段：外包矩形、增量层与引擎数组"""
+        header = {
+            'engine': self.ENGINE,
+            'resolution': self.resolution,
+            'feature_count': self.feature_count,
+            'fingerprint': self.fingerprint,
+            'meta': self._index_meta()
+        }
+        arrays = pack_arrays('bounds', {
+            'fids': self.feature_bounds.fids,
+            'boxes': self.feature_bounds.boxes
+        })
+        arrays.update(
+            pack_arrays(
+                'delta', {
+                    'fids': self.delta_bounds.fids,
+                    'boxes': self.delta_bounds.boxes,
+                    'tombstones': self.tombstones
+                }))
+        arrays.update(self._index_arrays())
+        return header, arrays
+
+    def write_index(self):
+        """将外包矩形、增量层与引擎数组写入索引文件"""
+        write_index_file(self.index_file, *self._index_contents())
+
+    def read_index(self):
+        """以内存映射方式打开索引文件，外包矩形与引擎数组均不复制"""
+        self._restore_contents(*open_index_file(self.index_file))
+
+    def export_shared(self, name=None):
+        """将索引内容导出到共享内存，返回 SharedMemory 对象
+
+        布局与索引文件相同。导出方负责在所有查询进程退出后调用
+        close() 与 unlink() 释放共享内存。
+        """
+        header, arrays = self._index_contents()
+        shm = shared_memory.SharedMemory(name=name,
+                                         create=True,
+                                         size=index_buffer_size(
+                                             header, arrays))
+        write_index_buffer(shm.buf, header, arrays)
+        return shm
+
+    def attach_shared(self, name):
+        """以只读方式挂载 export_shared() 导出的共享内存
+
+        外包矩形与 sorted/csr 倒排数组直接是共享内存的视图，不复制、不解析；
+        dict 存储仍需在本进程中展开为字典，memory 后端的 R 树需要重新装载；
+        disk 后端的 R 树打开导出方的 .dat/.idx（绝对路径记录在头部），
+        挂载方只读取这些文件，save_index() 与重建时写入自己的 file_prefix。
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 挂载时也会向 resource_tracker 登记，进程退出时
+            # 会把导出方的共享内存删除，挂载期间临时跳过登记
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        raw = np.ndarray(shm.size, dtype=np.uint8, buffer=shm.buf)
+        raw.flags.writeable = False
+        self._restore_contents(*read_index_buffer(raw))
+        # 保持挂载，数组视图的生命周期依赖它
+        self._shared_memory = shm
+
+    def _restore_contents(self, header, arrays):
+        """由头部与数组段恢复索引状态"""
+        if header['engine'] != self.ENGINE:
+            raise ValueError(f"索引文件属于 {header['engine']} 引擎，"
+                             f"无法作为 {self.ENGINE} 索引加载")
+
+        self.resolution = header['resolution']
+        self.feature_count = header['feature_count']
+        self.fingerprint = header['fingerprint']
+        bounds = unpack_arrays(arrays, 'bounds')
+        self.feature_bounds = FeatureBounds(bounds['fids'], bounds['boxes'])
+        self._invalidate_cache()
+        if self.covering_cache is not None:
+            self.covering_cache.clear()
+        delta = unpack_arrays(arrays, 'delta')
+        if delta:
+            self.delta_bounds = FeatureBounds(delta['fids'], delta['boxes'])
+            self.tombstones = delta['tombstones']
+        self._restore_index(header['meta'], arrays)
+
+    @property
+    def has_delta(self):
+        return len(self.delta_bounds) > 0 or len(self.tombstones) > 0
+
+    @property
+    def delta_size(self):
+        """增量层条目数：增量外包矩形与墓碑"""
+        return len(self.delta_bounds) + len(self.tombstones)
+
+    def delta_exceeded(self):
+        """增量层是否已超过并入主索引的阈值"""
+        size = self.delta_size
+        return (size > self.max_delta or
+                size > self.max_delta_ratio * len(self.feature_bounds))
+
+    @property
+    def has_bounds(self):
+        return len(self.feature_bounds) > 0 or len(self.delta_bounds) > 0
+
+    def current_bounds(self):
+        """主索引外包矩形去掉失效条目、再合并增量层后的当前外包矩形"""
+        if not self.has_delta:
+            return self.feature_bounds
+        return self.feature_bounds.drop(self.tombstones).upsert(
+            self.delta_bounds)
+
+    def contains(self, fid):
+        """索引中当前是否存在该要素"""
+        if self.delta_bounds.lookup([fid])[0] >= 0:
+            return True
+        return bool(self.feature_bounds.lookup([fid])[0] >= 0
+                    and not np.isin(fid, self.tombstones))
+
+    def apply_changes(self, upserts=None, deletes=None):
+        """批量写入增量层
+
+        upserts 为新增或更新要素的 FeatureBounds，deletes 为删除的 fid；
+        主索引中对应的旧条目以墓碑屏蔽，主索引本身不做修改。
+        修改只在内存中生效，需调用 save_index() 写入索引文件。
+        """
+        upserts = FeatureBounds() if upserts is None else upserts
+        deletes = np.asarray([] if deletes is None else deletes,
+                             dtype=np.int64)
+        changed = np.union1d(upserts.fids, deletes)
+        in_base = changed[self.feature_bounds.lookup(changed) >= 0]
+        self.tombstones = np.union1d(self.tombstones, in_base)
+        self.delta_bounds = self.delta_bounds.drop(deletes).upsert(upserts)
+        self.feature_count = (len(self.feature_bounds) -
+                              len(self.tombstones) + len(self.delta_bounds))
+        self._invalidate_cache()
+
+    def insert(self, fid, bounds):
+        """插入新要素，bounds 为 (minx, miny, maxx, maxy)"""
+        if self.contains(fid):
+            raise ValueError(f"要素 {fid} 已存在，请使用 update()")
+        self.apply_changes(upserts=FeatureBounds.from_columns(
+            [fid], *np.reshape(bounds, (4, 1))))
+
+    def update(self, fid, bounds):
+        """更新已有要素的外包矩形"""
+        if not self.contains(fid):
+            raise ValueError(f"要素 {fid} 不存在，请使用 insert()")
+        self.apply_changes(upserts=FeatureBounds.from_columns(
+            [fid], *np.reshape(bounds, (4, 1))))
+
+    def delete(self, fid):
+        """删除要素"""
+        if not self.contains(fid):
+            raise ValueError(f"要素 {fid} 不存在")
+        self.apply_changes(deletes=[fid])
+
+    def merge_delta(self):
+        """把增量层并入主索引：只重新计算覆盖，不重新扫描数据源"""
+        if not self.has_delta:
+            return
+        self.build_from_bounds(self.current_bounds(), self.fingerprint)
+
+    def source_changed(self, fingerprint=None):
+        """数据源的路径、大小、修改时间或要素数与索引记录的指纹是否不同"""
+        if self.fingerprint is None:
+            return True
+        fingerprint = fingerprint or dataset_fingerprint(self.data_path)
+        return any(fingerprint[key] != self.fingerprint.get(key)
+                   for key in ('path', 'size', 'mtime_ns', 'feature_count'))
+
+    def refresh(self, bounds=None, fingerprint=None):
+        """数据源有变化时重新提取外包矩形，只把差异写入增量层并保存
+
+        提取外包矩形是秒级的批量读取，而覆盖计算只针对变化的要素，
+        避免数据源小幅修改后整体重建索引。bounds 与 fingerprint 为已提取的
+        外包矩形与对应的数据源指纹，多个引擎可共用同一次扫描
+        （见 IndexBuilder.refresh）。返回变化的要素数。
+
+        数据源路径与构建时不同（已是另一份数据）时整体重建；增量层超过
+        阈值（见 delta_exceeded()）时并入主索引。
+        """
+        fingerprint = fingerprint or dataset_fingerprint(self.data_path)
+        if not self.source_changed(fingerprint):
+            return 0
+
+        new_bounds = bounds if bounds is not None else read_feature_bounds(
+            self.data_path, self.workers)
+        if self.fingerprint is None or \
+                fingerprint['path'] != self.fingerprint['path']:
+            print("数据源路径已变化，重建索引")
+            self.build_from_bounds(new_bounds, fingerprint)
+            return len(new_bounds)
+
+        current = self.current_bounds()
+        deletes = np.setdiff1d(current.fids,
+                               new_bounds.fids,
+                               assume_unique=True)
+        rows = current.lookup(new_bounds.fids)
+        same = rows >= 0
+        same[same] = (current.boxes[:, rows[same]] ==
+                      new_bounds.boxes[:, same]).all(axis=0)
+        upserts = FeatureBounds(new_bounds.fids[~same],
+                                new_bounds.boxes[:, ~same])
+
+        self.apply_changes(upserts, deletes)
+        self.fingerprint = fingerprint
+        print(f"数据源已变化，增量更新 {len(upserts) + len(deletes)} 个要素")
+        if self.delta_exceeded():
+            print(f"增量层共 {self.delta_size} 条，并入主索引")
+            # 重新计算覆盖后保存索引
+            self.merge_delta()
+        else:
+            self.save_index()
+        return len(upserts) + len(deletes)
+
+    def _bounds_mask(self, fids, bboxes):
+        """按当前外包矩形（含增量层）逐个判断 fid 是否与对应的 bbox 相交"""
+        mask = self.feature_bounds.intersects(fids, bboxes)
+        if not self.has_delta:
+            return mask
+        in_delta = self.delta_bounds.lookup(fids) >= 0
+        return np.where(in_delta, self.delta_bounds.intersects(fids, bboxes),
+                        mask & ~np.isin(fids, self.tombstones))
+
+    def _candidates(self, bbox):
+        """候选要素（含增量层），开启缓存时先查缓存"""
+        cache = self.query_cache
+        if cache is None:
+            return self._apply_delta(self._lookup(bbox), bbox)
+
+        key = cache.key(bbox)
+        candidate_fids = cache.get(key)
+        trace = self._trace
+        if trace is not None:
+            trace.lap('cache')
+            trace.count('cache_hits', candidate_fids is not None)
+        if candidate_fids is None:
+            candidate_fids = self._apply_delta(self._lookup(key), key)
+            cache.put(key, candidate_fids)
+            if trace is not None:
+                trace.lap('cache')
+        return candidate_fids
+
+    def _lookup(self, bbox):
+        """由引擎获取候选要素，记录时计入 lookup 阶段"""
+        candidate_fids = self._query_candidates(bbox)
+        if self._trace is not None:
+            self._trace.lap('lookup')
+        return candidate_fids
+
+    def _lookup_batch(self, bboxes):
+        """_lookup 的批量版本"""
+        offsets, fids = self._query_candidates_batch(bboxes)
+        if self._trace is not None:
+            self._trace.lap('lookup')
+        return offsets, fids
+
+    def _candidates_batch(self, bboxes):
+        """_candidates 的批量版本，只对未命中缓存的 bbox 计算候选"""
+        cache = self.query_cache
+        if cache is None:
+            return self._apply_delta_batch(bboxes, *self._lookup_batch(bboxes))
+
+        trace = self._trace
+        keys = [cache.key(bbox) for bbox in bboxes.tolist()]
+        results = [cache.get(key) for key in keys]
+        missing = [i for i, fids in enumerate(results) if fids is None]
+        if trace is not None:
+            trace.lap('cache')
+            trace.count('cache_hits', len(results) - len(missing))
+        if missing:
+            miss_boxes = np.array([keys[i] for i in missing],
+                                  dtype=np.float64).reshape(-1, 4)
+            offsets, fids = self._apply_delta_batch(
+                miss_boxes, *self._lookup_batch(miss_boxes))
+            for j, i in enumerate(missing):
+                results[i] = fids[offsets[j]:offsets[j + 1]].copy()
+                cache.put(keys[i], results[i])
+            if trace is not None:
+                trace.lap('cache')
+
+        offsets = np.zeros(len(results) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in results], out=offsets[1:])
+        fids = np.concatenate(results) if results else np.empty(
+            0, dtype=np.int64)
+        return offsets, fids
+
+    def _apply_delta(self, candidate_fids, bbox):
+        """剔除主索引中已失效的候选，并补充增量层中与 bbox 相交的要素"""
+        if not self.has_delta:
+            return candidate_fids
+        candidate_fids = candidate_fids[~np.isin(candidate_fids,
+                                                 self.tombstones)]
+        _, delta_fids = self.delta_bounds.query_pairs(bbox)
+        candidate_fids = np.union1d(candidate_fids, delta_fids)
+        if self._trace is not None:
+            self._trace.lap('delta')
+        return candidate_fids
+
+    def _apply_delta_batch(self, bboxes, offsets, fids):
+        """_apply_delta 的批量版本，输入输出均为 CSR 结构"""
+        if not self.has_delta:
+            return offsets, fids
+        query_ids = np.repeat(np.arange(len(bboxes)), np.diff(offsets))
+        keep = ~np.isin(fids, self.tombstones)
+        delta_query_ids, delta_fids = self.delta_bounds.query_pairs(bboxes)
+        offsets, fids = group_unique(
+            np.concatenate([query_ids[keep], delta_query_ids]),
+            np.concatenate([fids[keep], delta_fids]), len(bboxes))
+        if self._trace is not None:
+            self._trace.lap('delta')
+        return offsets, fids
+
+    def enable_cache(self,
+                     max_entries=1024,
+                     max_bytes=64 * 1024 * 1024,
+                     ttl=None,
+                     snap=0.0):
+        """开启查询候选结果缓存
+
+        snap > 0 时 bbox 向外对齐到 snap 度的格网后作为缓存键，相近的视口
+        共用同一条目；此时未做精确验证的结果是对齐后 bbox 的候选集。
+        """
+        self.query_cache = QueryCache(max_entries, max_bytes, ttl, snap)
+        return self.query_cache
+
+    def disable_cache(self):
+        self.query_cache = None
+
+    def cache_stats(self):
+        """缓存条目数、占用字节与命中/未命中计数"""
+        return None if self.query_cache is None else self.query_cache.stats()
+
+    def _invalidate_cache(self):
+        if self.query_cache is not None:
+            self.query_cache.clear()
+
+    def enable_covering_cache(self,
+                              quantum=1e-3,
+                              tile_size=None,
+                              max_entries=4096,
+                              max_tiles=64):
+        """开启查询覆盖缓存
+
+        覆盖按向外对齐到 quantum 度后的 bbox 与分辨率记忆化；指定 tile_size
+        时大 bbox 切分为对齐瓦片分别缓存。覆盖只会扩大，查询结果仍是完整的
+        候选集，精确验证后的结果不变。
+        """
+        self.covering_cache = CoveringCache(quantum, tile_size, max_entries,
+                                            max_tiles)
+        return self.covering_cache
+
+    def disable_covering_cache(self):
+        self.covering_cache = None
+
+    def _covering(self, cover, bbox):
+        """计算 bbox 的查询覆盖，开启覆盖缓存时经缓存获取"""
+        trace = self._trace
+        if trace is None:
+            if self.covering_cache is None:
+                return cover(bbox)
+            return self.covering_cache.get(cover, bbox, self.resolution)
+
+        trace.lap('lookup')
+        if self.covering_cache is None:
+            covering = cover(bbox)
+        else:
+            covering = self.covering_cache.get(cover, bbox, self.resolution)
+        trace.lap('covering')
+        # 区间覆盖 (starts, stops) 按区间数计
+        trace.count(
+            'cells',
+            len(covering[0]) if isinstance(covering, tuple) else len(covering))
+        return covering
+
+    def _lookup_ranges_batch(self, postings, cover, bboxes):
+        """区间覆盖的批量查找：汇总全部查询的 (starts, stops) 后一次查找倒排表
+
+        cover 为返回 (starts, stops) 区间数组的覆盖函数，postings 为
+        SortedPostings 或 CSRPostings。
+        """
+        ranges = [self._covering(cover, bbox) for bbox in bboxes.tolist()]
+        query_ids = np.repeat(np.arange(len(ranges)),
+                              [len(starts) for starts, _ in ranges])
+        starts = np.concatenate([r[0] for r in ranges])
+        stops = np.concatenate([r[1] for r in ranges])
+        return postings.lookup_ranges_batch(query_ids, starts, stops,
+                                            len(bboxes))
+
+    def instrument(self, sink):
+        """开启查询分阶段记录
+
+        sink 为带 record(trace) 方法的对象（见 instrumentation 模块）或
+        回调函数，每次 query()/query_by_bbox()/query_by_bboxes() 结束后收到
+        一条 QueryTrace；sink 为 None 时关闭。关闭时查询路径上只多一次
+        属性判断。记录期间的状态保存在索引对象上，多线程并发查询时应
+        各自使用独立的索引对象（可经 attach_shared() 共享数据）。
+        """
+        if sink is not None and not hasattr(sink, 'record'):
+            sink = CallbackSink(sink)
+        self.instrumentation = sink
+        return sink
+
+    def _traced(self, func, queries, *args):
+        """以记录模式执行查询，结束后把 QueryTrace 交给 sink"""
+        trace = self._trace = QueryTrace(self.ENGINE, self.resolution,
+                                         queries)
+        try:
+            result = func(*args)
+        finally:
+            self._trace = None
+        trace.finish()
+        self.instrumentation.record(trace)
+        return result
+
+    def _index_meta(self):
+        """引擎自身需要写入文件头部的参数（可 JSON 序列化）"""
+        return {}
+
+    def _index_arrays(self):
+        """引擎自身需要写入文件的数组，名称应带段前缀"""
+        return {}
+
+    def _restore_index(self, meta, arrays):
+        """由文件头部参数与数组恢复引擎状态"""
+        pass
+
+    def refine_by_bounds(self, candidate_fids, bbox):
+        """矩形精确验证：剔除外包矩形与 bbox 不相交的候选要素"""
+        fids = np.asarray(candidate_fids, dtype=np.int64)
+        if len(fids) and not self.has_bounds:
+            raise RuntimeError("外包矩形未加载，无法进行精确验证")
+        fids = fids[self._bounds_mask(fids, bbox)]
+        if self._trace is not None:
+            self._trace.lap('refine')
+        return fids
+
+    def refine_by_geometry(self, candidate_fids, bbox):
+        """几何精确验证：读取候选要素几何，与查询矩形做向量化相交判断"""
+        fids = np.asarray(candidate_fids, dtype=np.int64)
+        trace = self._trace
+        if self.has_bounds:
+            # 先用外包矩形过滤，减少需要读取的几何
+            fids = fids[self._bounds_mask(fids, bbox)]
+            if trace is not None:
+                trace.lap('refine')
+        fids, geoms = read_geometries(self.data_path, fids)
+        if trace is not None:
+            trace.lap('fetch')
+            trace.count('fetched', len(fids))
+        if not len(fids):
+            return fids
+
+        query = shapely.box(*bbox)
+        shapely.prepare(query)
+        fids = fids[shapely.intersects(query, geoms)]
+        if trace is not None:
+            trace.lap('refine')
+        return fids
+
+    def query(self, bbox, exact_check=False, geometry_check=False):
+        """基于 BBox 查询要素，返回 (候选 fid 数组, 结果 fid 数组)，不输出信息"""
+        if self.instrumentation is not None:
+            return self._traced(self._query, 1, bbox, exact_check,
+                                geometry_check)
+        return self._query(bbox, exact_check, geometry_check)
+
+    def _query(self, bbox, exact_check, geometry_check):
+        candidate_fids = self._candidates(bbox)
+
+        results = candidate_fids
+        if geometry_check:
+            results = self.refine_by_geometry(candidate_fids, bbox)
+        elif exact_check:
+            results = self.refine_by_bounds(candidate_fids, bbox)
+
+        trace = self._trace
+        if trace is not None:
+            trace.count('candidates', len(candidate_fids))
+            trace.count('results', len(results))
+        return candidate_fids, results
+
+    def query_by_bbox(self, bbox, exact_check=False, geometry_check=False):
+        """基于 BBox 查询要素，返回结果 fid 列表
+
+        exact_check 为 True 时对候选要素做矩形精确验证，剔除格网带来的误检；
+        geometry_check 为 True 时进一步按真实几何与查询矩形求交。
+        耗时与候选数等信息见 instrument()。
+        """
+        _, results = self.query(bbox, exact_check, geometry_check)
+        return results.tolist()
+
+    def query_by_bboxes(self, bboxes, exact_check=False, geometry_check=False):
+        """批量 BBox 查询
+
+        bboxes 为 (N, 4) 数组，返回 CSR 结构 (offsets, fids)：第 i 个查询的
+        结果为 fids[offsets[i]:offsets[i + 1]]，fids 为 int64 数组。
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        if self.instrumentation is not None:
+            return self._traced(self._query_batch, len(bboxes), bboxes,
+                                exact_check, geometry_check)
+        return self._query_batch(bboxes, exact_check, geometry_check)
+
+    def _query_batch(self, bboxes, exact_check, geometry_check):
+        trace = self._trace
+        offsets, fids = self._candidates_batch(bboxes)
+        if trace is not None:
+            trace.count('candidates', len(fids))
+        if not (exact_check or geometry_check):
+            if trace is not None:
+                trace.count('results', len(fids))
+            return offsets, fids
+
+        query_ids = np.repeat(np.arange(len(bboxes)), np.diff(offsets))
+        if len(fids) and not self.has_bounds:
+            raise RuntimeError("外包矩形未加载，无法进行精确验证")
+        mask = self._bounds_mask(fids, bboxes[query_ids])
+        query_ids, fids = query_ids[mask], fids[mask]
+        if trace is not None:
+            trace.lap('refine')
+
+        if geometry_check:
+            # 每个要素的几何只读取一次
+            uniq, inverse = np.unique(fids, return_inverse=True)
+            _, geoms = read_geometries(self.data_path, uniq)
+            if trace is not None:
+                trace.lap('fetch')
+                trace.count('fetched', len(uniq))
+            query_boxes = shapely.box(*bboxes[query_ids].T)
+            mask = shapely.intersects(query_boxes, geoms[inverse])
+            query_ids, fids = query_ids[mask], fids[mask]
+
+        offsets, fids = group_unique(query_ids, fids, len(bboxes))
+        if trace is not None:
+            trace.lap('refine')
+            trace.count('results', len(fids))
+        return offsets, fids
+
+    def _query_candidates_batch(self, bboxes):
+        """批量获取候选要素，默认逐个调用 _query_candidates，子类可覆盖"""
+        results = [self._query_candidates(bbox) for bbox in bboxes.tolist()]
+        offsets = np.zeros(len(results) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in results], out=offsets[1:])
+        fids = np.concatenate(results) if results else np.empty(
+            0, dtype=np.int64)
+        return offsets, fids.astype(np.int64, copy=False)
 
-    @abstractmethod
     def build_index(self):
+        """扫描数据源提取外包矩形，再构建索引"""
+        fingerprint = dataset_fingerprint(self.data_path)
+        self.build_from_bounds(
+            read_feature_bounds(self.data_path, self.workers), fingerprint)
+
+    def build_from_bounds(self, bounds, fingerprint=None):
+        """由已提取的外包矩形（FeatureBounds）构建索引，多个引擎可共用同一份
+
+        fingerprint 为这份外包矩形对应的数据源指纹，默认取当前数据源。
+        """
+        self.fingerprint = fingerprint or dataset_fingerprint(self.data_path)
+        self.delta_bounds = FeatureBounds()
+        self.tombstones = np.empty(0, dtype=np.int64)
+        self._build_from_bounds(bounds)
+        self._invalidate_cache()
+        if self.covering_cache is not None:
+            # H3 compact 等覆盖依赖索引中实际出现的分辨率
+            self.covering_cache.clear()
+
+    @abstractmethod
+    def _build_from_bounds(self, bounds):
+        """由外包矩形计算覆盖、构建并保存引擎自身的索引"""
         pass
 
     @abstractmethod
-    def query_by_bbox(self, bbox):
+    def _query_candidates(self, bbox):
+        """返回与 bbox 可能相交的候选 fid（int64 数组，无重复）"""
         pass
 
     @abstractmethod
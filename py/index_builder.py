@@ -0,0 +1,102 @@
+# index_builder.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from index_base import (read_feature_bounds, resolve_workers,
+                        dataset_fingerprint, process_pool)
+
+
+class IndexBuilder:
+    """多引擎构建协调器
+
+    对同一个数据源只扫描一次，提取出的外包矩形数组交给所有已登记引擎的
+    build_from_bounds，各引擎不再各自打开数据源、重复读取几何。
+    """
+
+    def __init__(self, data_path, workers=1):
+        self.data_path = data_path
+        # 提取外包矩形时的进程数，None 表示使用全部 CPU 核心
+        self.workers = resolve_workers(workers)
+        self.engines = {}
+
+    def register(self, name, engine):
+        """登记一个引擎，引擎的数据源必须与协调器一致"""
+        if os.path.abspath(engine.data_path) != os.path.abspath(
+                self.data_path):
+            raise ValueError(f"{name} 的数据源与协调器不一致: {engine.data_path}")
+        self.engines[name] = engine
+        return engine
+
+    def build(self, names=None, concurrent=False):
+        """扫描一次数据源，为 names 指定的引擎（默认全部）构建索引
+
+        concurrent 为 True 时各引擎在线程中同时构建，覆盖计算提交到共用的
+        进程池（max(workers, 引擎数) 个进程）：s2sphere 与 H3 的逐要素覆盖
+        是纯 Python 循环，持有 GIL，放在线程中不能并行。线程只负责调度、
+        倒排表排序与 R 树装载。返回共用的 FeatureBounds。
+        """
+        names = list(self.engines) if names is None else list(names)
+        if not names:
+            print("没有需要构建的索引")
+            return None
+
+        start_time = time.time()
+        fingerprint = dataset_fingerprint(self.data_path)
+        bounds = read_feature_bounds(self.data_path, self.workers)
+        print(f"外包矩形提取完成! 共 {len(bounds)} 个要素, "
+              f"耗时: {time.time() - start_time:.2f}秒")
+
+        if concurrent and len(names) > 1:
+            engines = [self.engines[name] for name in names]
+            with process_pool(max(self.workers, len(names))) as pool, \
+                    ThreadPoolExecutor(max_workers=len(names)) as threads:
+                for engine in engines:
+                    engine.pool = pool
+                try:
+                    futures = [
+                        threads.submit(engine.build_from_bounds, bounds,
+                                       fingerprint) for engine in engines
+                    ]
+                    for future in futures:
+                        future.result()
+                finally:
+                    for engine in engines:
+                        engine.pool = None
+        else:
+            for name in names:
+                print(f"Building {name} index...")
+                self.engines[name].build_from_bounds(bounds, fingerprint)
+
+        print(f"全部索引构建完成! 总耗时: {time.time() - start_time:.2f}秒")
+        return bounds
+
+    def refresh(self, names=None):
+        """数据源有变化时为 names 指定的引擎（默认全部）增量更新
+
+        只计算一次指纹；有引擎需要更新时只扫描一次数据源，外包矩形交给
+        各引擎的 refresh() 与各自的当前状态比较。返回 {引擎名: 变化要素数}。
+        """
+        names = list(self.engines) if names is None else list(names)
+        fingerprint = dataset_fingerprint(self.data_path)
+        stale = [
+            name for name in names
+            if self.engines[name].source_changed(fingerprint)
+        ]
+        changes = {name: 0 for name in names}
+        if not stale:
+            return changes
+
+        start_time = time.time()
+        bounds = read_feature_bounds(self.data_path, self.workers)
+        print(f"外包矩形提取完成! 共 {len(bounds)} 个要素, "
+              f"耗时: {time.time() - start_time:.2f}秒")
+        for name in stale:
+            print(f"Refreshing {name} index...")
+            changes[name] = self.engines[name].refresh(bounds, fingerprint)
+        return changes
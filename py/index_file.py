@@ -0,0 +1,108 @@
+# index_file.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import json
+import os
+import struct
+
+import numpy as np
+
+# 文件布局：
+#   MAGIC(8) | 版本 u32 | 头部长度 u32 | JSON 头部 | 对齐填充 | 数组段...
+# 头部记录引擎、分辨率、要素数、数据源指纹以及各数组段的
+# dtype/shape/offset（相对数据区起点），每个数组段按 ALIGNMENT 字节对齐，
+# 加载时整个文件以 np.memmap 只读映射，数组直接是文件内容的视图。
+MAGIC = b'SPIDX\x00\x00\x01'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct('<8sII')
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(header, arrays):
+    """计算各数组段的位置，返回 (头部字节, 数据区起点, 数组列表, 总字节数)"""
+    sections = {}
+    offset = 0
+    ordered = []
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        sections[name] = {
+            'dtype': arr.dtype.str,
+            'shape': list(arr.shape),
+            'offset': offset
+        }
+        ordered.append((offset, arr))
+        offset = _align(offset + arr.nbytes)
+
+    header = dict(header, format_version=FORMAT_VERSION, arrays=sections)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _align(_PREFIX.size + len(header_bytes))
+    return header_bytes, data_start, ordered, data_start + offset
+
+
+def index_buffer_size(header, arrays):
+    """索引内容序列化后的总字节数"""
+    return _layout(header, arrays)[3]
+
+
+def write_index_buffer(buf, header, arrays):
+    """将索引内容写入可写缓冲区（如共享内存），布局与索引文件相同"""
+    header_bytes, data_start, ordered, total = _layout(header, arrays)
+    out = np.frombuffer(buf, dtype=np.uint8, count=total)
+    prefix = _PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes))
+    out[:_PREFIX.size] = np.frombuffer(prefix, dtype=np.uint8)
+    out[_PREFIX.size:_PREFIX.size + len(header_bytes)] = np.frombuffer(
+        header_bytes, dtype=np.uint8)
+    for offset, arr in ordered:
+        start = data_start + offset
+        out[start:start + arr.nbytes] = arr.reshape(-1).view(np.uint8)
+    return total
+
+
+def write_index_file(path, header, arrays):
+    """写入索引文件（先写临时文件再替换，避免读到写了一半的文件）"""
+    header_bytes, data_start, ordered, total = _layout(header, arrays)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for offset, arr in ordered:
+            f.seek(data_start + offset)
+            f.write(arr.reshape(-1).view(np.uint8).data)
+        f.truncate(total)
+    os.replace(tmp_path, path)
+
+
+def read_index_buffer(raw):
+    """解析 uint8 数组形式的索引内容，返回 (头部, 数组字典)，数组为零拷贝视图"""
+    if len(raw) < _PREFIX.size:
+        raise ValueError("索引文件格式不正确")
+    magic, version, header_len = _PREFIX.unpack(bytes(raw[:_PREFIX.size]))
+    if magic != MAGIC:
+        raise ValueError("索引文件格式不正确")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"不支持的索引文件版本: {version}")
+
+    header = json.loads(
+        bytes(raw[_PREFIX.size:_PREFIX.size + header_len]).decode('utf-8'))
+    data_start = _align(_PREFIX.size + header_len)
+    arrays = {}
+    for name, section in header['arrays'].items():
+        dtype = np.dtype(section['dtype'])
+        shape = tuple(section['shape'])
+        start = data_start + section['offset']
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        arrays[name] = raw[start:start + nbytes].view(dtype).reshape(shape)
+    return header, arrays
+
+
+def open_index_file(path):
+    """以只读内存映射方式打开索引文件，返回 (头部, 数组字典)"""
+    return read_index_buffer(np.memmap(path, dtype=np.uint8, mode='r'))
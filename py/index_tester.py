@@ -4,27 +4,36 @@
 #   @date: 2025-07-23
 #
 
-import time
+from benchmark import Benchmark
 from visualization import Visualizer
 
 
 class IndexTester:
 
-    def __init__(self, data_path, bbox):
+    def __init__(self, data_path, bbox, warmup=3, repeat=20):
         self.data_path = data_path
         self.bbox = bbox
+        self.warmup = warmup
+        self.repeat = repeat
 
     def run_performance_test(self, indexers, visualize=False):
         print("\n===== 性能测试开始 =====")
 
+        benchmark = Benchmark(indexers, self.warmup, self.repeat)
+        records = []
         for name, indexer in indexers.items():
             print(f"\n[测试] {name}:")
-            start_time = time.time()
-            results = indexer.query_by_bbox(self.bbox)
-            duration = (time.time() - start_time) * 1000
-            print(f"总耗时: {duration:.2f}ms, 结果数: {len(results)}")
+            record = benchmark.run_case(name, indexer, [self.bbox])
+            records.append(record)
+            print(f"预热 {self.warmup} 次, 计时 {self.repeat} 次, "
+                  f"p50: {record['p50_ms']:.2f}ms, "
+                  f"p95: {record['p95_ms']:.2f}ms, "
+                  f"p99: {record['p99_ms']:.2f}ms, "
+                  f"结果数: {record['mean_results']:.0f}")
             if visualize:
+                results = indexer.query_by_bbox(self.bbox)
                 Visualizer.visualize_results(self.data_path, results,
                                              self.bbox, name)
 
         print("===== 性能测试结束 =====")
+        return records
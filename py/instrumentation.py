@@ -0,0 +1,157 @@
+# instrumentation.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import json
+import threading
+import time
+
+import numpy as np
+
+# 查询阶段，按执行顺序排列
+#   cache:    查询结果缓存的键计算与查找
+#   covering: 查询覆盖（单元格/区间）的生成，含覆盖缓存
+#   lookup:   倒排表/R 树查找及候选合并去重
+#   delta:    剔除失效条目、合并增量层
+#   refine:   外包矩形或几何精确验证（不含几何读取）
+#   fetch:    读取候选要素几何
+STAGES = ('cache', 'covering', 'lookup', 'delta', 'refine', 'fetch')
+
+# 直方图桶数：第 i 个桶为 [2^(i-1), 2^i) 纳秒
+BUCKETS = 64
+
+
+class QueryTrace:
+    """一次查询（或一次批量查询）的分阶段耗时与计数
+
+    lap(stage) 把上一次记录以来经过的时间计入 stage，嵌套调用的阶段
+    （如 lookup 中的 covering）因此可以自然地切分开。
+    """
+
+    __slots__ = ('engine', 'resolution', 'queries', 'stages', 'counts',
+                 'start', 'end', '_mark')
+
+    def __init__(self, engine, resolution, queries=1):
+        self.engine = engine
+        self.resolution = resolution
+        # 批量查询时为 bbox 个数
+        self.queries = queries
+        self.stages = {}
+        self.counts = {}
+        self.start = self._mark = time.perf_counter_ns()
+        self.end = None
+
+    def lap(self, stage):
+        now = time.perf_counter_ns()
+        self.stages[stage] = self.stages.get(stage, 0) + now - self._mark
+        self._mark = now
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def finish(self):
+        self.end = time.perf_counter_ns()
+
+    @property
+    def total_ns(self):
+        return (self.end or time.perf_counter_ns()) - self.start
+
+    def to_dict(self):
+        return {
+            'engine': self.engine,
+            'resolution': self.resolution,
+            'queries': self.queries,
+            'total_ms': self.total_ns / 1e6,
+            'stages_ms': {k: v / 1e6
+                          for k, v in self.stages.items()},
+            'counts': dict(self.counts)
+        }
+
+
+class HistogramSink:
+    """内存中的对数直方图：按 (引擎, 阶段) 累计耗时分布与计数总和
+
+    每条记录只做几次整数运算，内存占用固定，适合长时间运行的服务。
+    分位数为桶上界的近似值（误差不超过 2 倍）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.totals = {}
+        self.counts = {}
+        self.traces = 0
+
+    def record(self, trace):
+        with self._lock:
+            self.traces += 1
+            items = list(trace.stages.items())
+            items.append(('total', trace.total_ns))
+            for stage, ns in items:
+                key = (trace.engine, stage)
+                hist = self.histograms.get(key)
+                if hist is None:
+                    hist = self.histograms[key] = np.zeros(BUCKETS, np.int64)
+                    self.totals[key] = 0
+                hist[min(int(ns).bit_length(), BUCKETS - 1)] += 1
+                self.totals[key] += ns
+            for name, n in trace.counts.items():
+                key = (trace.engine, name)
+                self.counts[key] = self.counts.get(key, 0) + n
+
+    def summary(self):
+        """按 (引擎, 阶段) 汇总次数、平均与近似 p50/p95/p99（毫秒）"""
+        rows = []
+        with self._lock:
+            for (engine, stage), hist in self.histograms.items():
+                n = int(hist.sum())
+                cumulative = np.cumsum(hist)
+                row = {
+                    'engine': engine,
+                    'stage': stage,
+                    'count': n,
+                    'mean_ms': self.totals[(engine, stage)] / n / 1e6
+                }
+                for q in (50, 95, 99):
+                    bucket = int(np.searchsorted(cumulative, n * q / 100))
+                    row[f'p{q}_ms'] = (1 << bucket) / 1e6
+                rows.append(row)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.totals.clear()
+            self.counts.clear()
+            self.traces = 0
+
+
+class JsonLinesSink:
+    """每条记录写为一行 JSON，写入调用方给出的文件路径或文件对象"""
+
+    def __init__(self, target):
+        self._lock = threading.Lock()
+        self._own = isinstance(target, str)
+        self.file = open(target, 'a', encoding='utf-8') \
+            if self._own else target
+
+    def record(self, trace):
+        line = json.dumps(trace.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        if self._own:
+            self.file.close()
+
+
+class CallbackSink:
+    """把每条记录交给回调函数处理"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, trace):
+        self.callback(trace)
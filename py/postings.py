@@ -0,0 +1,315 @@
+# postings.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+from collections import defaultdict
+from itertools import chain
+
+import numpy as np
+
+# 倒排表的存储方式
+STORAGES = ('dict', 'sorted', 'csr')
+
+
+def concat_ranges(starts, stops):
+    """将若干 [start, stop) 区间展开并拼接为一个下标数组"""
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(stops, dtype=np.int64) - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    out_starts = np.cumsum(lengths) - lengths
+    return np.arange(total, dtype=np.int64) + np.repeat(
+        starts - out_starts, lengths)
+
+
+def group_unique(query_ids, fids, n_queries):
+    """按查询号分组去重，返回 CSR 结构 (offsets, fids)，组内 fid 升序"""
+    query_ids = np.asarray(query_ids, dtype=np.int64)
+    fids = np.asarray(fids, dtype=np.int64)
+    order = np.lexsort((fids, query_ids))
+    query_ids, fids = query_ids[order], fids[order]
+    keep = np.ones(len(fids), dtype=bool)
+    keep[1:] = (query_ids[1:] != query_ids[:-1]) | (fids[1:] != fids[:-1])
+    query_ids, fids = query_ids[keep], fids[keep]
+    offsets = np.zeros(n_queries + 1, dtype=np.int64)
+    np.cumsum(np.bincount(query_ids, minlength=n_queries), out=offsets[1:])
+    return offsets, fids
+
+
+def merge_postings(postings, query_ids, cells, n_queries):
+    """批量查询的倒排表合并：每个单元格只查一次字典，再按查询号分组去重"""
+    if not len(cells):
+        return group_unique(query_ids, query_ids, n_queries)
+    uniq, inverse = np.unique(cells, return_inverse=True)
+    lists = [postings.get(cell, ()) for cell in uniq.tolist()]
+    lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    posting_fids = np.fromiter(chain.from_iterable(lists),
+                               dtype=np.int64,
+                               count=int(lengths.sum()))
+    posting_offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    starts = posting_offsets[inverse]
+    stops = posting_offsets[inverse + 1]
+    positions = concat_ranges(starts, stops)
+    return group_unique(np.repeat(query_ids, stops - starts),
+                        posting_fids[positions], n_queries)
+
+
+class SortedPostings:
+    """按键排序的 (key, fid) 倒排数组
+
+    keys 与 fids 等长，keys 升序。某个键区间 [start, stop) 内的全部条目
+    通过两次二分查找即可定位，适合层级编码（GeoHash 前缀、S2 单元格范围等）。
+    """
+
+    def __init__(self, keys=None, fids=None, key_dtype=np.int64):
+        if keys is None:
+            keys = np.empty(0, dtype=key_dtype)
+            fids = np.empty(0, dtype=np.int64)
+        self.keys = keys
+        self.fids = fids
+
+    @classmethod
+    def from_pairs(cls, keys, fids, key_dtype=np.int64):
+        """由无序的 (key, fid) 对构建"""
+        keys = np.asarray(keys, dtype=key_dtype)
+        fids = np.asarray(fids, dtype=np.int64)
+        order = np.lexsort((fids, keys))
+        return cls(keys[order], fids[order])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _positions(self, starts, stops):
+        """返回键落在各 [start, stop) 区间内的条目下标"""
+        lo = np.searchsorted(self.keys, starts, side='left')
+        hi = np.searchsorted(self.keys, stops, side='left')
+        return concat_ranges(lo, hi), hi - lo
+
+    def lookup_ranges(self, starts, stops):
+        """返回键落在任一 [start, stop) 区间内的 fid（去重）"""
+        positions, _ = self._positions(starts, stops)
+        return np.unique(self.fids[positions])
+
+    def lookup_ranges_batch(self, query_ids, starts, stops, n_queries):
+        """批量区间查找，返回按查询号分组去重后的 CSR 结构 (offsets, fids)"""
+        positions, counts = self._positions(starts, stops)
+        return group_unique(np.repeat(query_ids, counts), self.fids[positions],
+                            n_queries)
+
+    def to_arrays(self):
+        """导出为待写入索引文件的数组字典"""
+        return {'keys': self.keys, 'fids': self.fids}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """由索引文件中的数组（零拷贝视图）恢复"""
+        return cls(arrays['keys'], arrays['fids'])
+
+
+def varint_encode(values):
+    """无符号整数数组的 varint 编码（每字节低 7 位为数据，最高位为续位）"""
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+
+    out_offsets = np.cumsum(nbytes) - nbytes
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for j in range(int(nbytes.max()) if len(values) else 0):
+        has = nbytes > j
+        chunk = (values[has] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        more = (nbytes[has] - 1 > j).astype(np.uint64) << np.uint64(7)
+        out[out_offsets[has] + j] = (chunk | more).astype(np.uint8)
+    return out
+
+
+def varint_decode(data):
+    """varint_encode 的逆运算"""
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=np.uint64)
+    ends = data < 0x80
+    value_starts = np.flatnonzero(np.concatenate([[True], ends[:-1]]))
+    value_ids = np.cumsum(np.concatenate([[0], ends[:-1]]))
+    shifts = (np.arange(len(data)) - value_starts[value_ids]) * 7
+    parts = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.bitwise_or.reduceat(parts, value_starts)
+
+
+class CSRPostings:
+    """压缩行（CSR）格式的倒排表
+
+    keys 为升序且唯一的单元格键，第 i 个键的 fid 列表为
+    fids[offsets[i]:offsets[i + 1]]（组内升序）。由于键有序，
+    键区间 [start, stop) 内全部键的倒排表在 fids 中是连续的一段。
+
+    compression='varint' 时各列表做差分后以 varint 编码存入 data，
+    byte_offsets 记录各列表在 data 中的起止位置，查找时按需解码。
+    """
+
+    def __init__(self,
+                 keys,
+                 offsets,
+                 fids=None,
+                 data=None,
+                 byte_offsets=None):
+        self.keys = keys
+        self.offsets = offsets
+        self.fids = fids
+        self.data = data
+        self.byte_offsets = byte_offsets
+
+    @property
+    def compression(self):
+        return None if self.data is None else 'varint'
+
+    @classmethod
+    def from_pairs(cls, keys, fids, key_dtype=np.int64, compression=None):
+        """由无序的 (key, fid) 对构建，重复的对只保留一个"""
+        if compression not in (None, 'varint'):
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        pairs = SortedPostings.from_pairs(keys, fids, key_dtype)
+        keys, fids = pairs.keys, pairs.fids
+
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (fids[1:] != fids[:-1])
+        keys, fids = keys[keep], fids[keep]
+
+        unique_keys, starts = np.unique(keys, return_index=True)
+        offsets = np.append(starts, len(keys)).astype(np.int64)
+        if compression is None:
+            return cls(unique_keys, offsets, fids=fids)
+
+        # 组内差分，每个列表的首个值保存原值
+        deltas = fids.copy()
+        deltas[1:] -= fids[:-1]
+        deltas[starts] = fids[starts]
+        data = varint_encode(deltas)
+        # 每个值编码的起始字节，用于得到各列表的字节偏移
+        value_starts = np.append(
+            np.flatnonzero(np.concatenate([[True], data[:-1] < 0x80])),
+            len(data)) if len(data) else np.zeros(1, dtype=np.int64)
+        byte_offsets = value_starts[offsets].astype(np.int64)
+        return cls(unique_keys, offsets, data=data, byte_offsets=byte_offsets)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def _decode_lists(self, list_ids):
+        """按顺序解码若干列表，返回拼接后的 fid 数组"""
+        if self.data is None:
+            return self.fids[concat_ranges(self.offsets[list_ids],
+                                           self.offsets[list_ids + 1])]
+
+        data = self.data[concat_ranges(self.byte_offsets[list_ids],
+                                       self.byte_offsets[list_ids + 1])]
+        deltas = varint_decode(data).astype(np.int64)
+        counts = self.offsets[list_ids + 1] - self.offsets[list_ids]
+        # 分段前缀和：整体 cumsum 后减去各段起点之前的累计值
+        sums = np.cumsum(deltas)
+        seg_starts = np.cumsum(counts) - counts
+        base = np.where(seg_starts > 0, sums[seg_starts - 1], 0) \
+            if len(sums) else seg_starts
+        return sums - np.repeat(base, counts)
+
+    def _lists(self, starts, stops):
+        """返回键落在各 [start, stop) 区间内的列表下标及各区间的 fid 数"""
+        lo = np.searchsorted(self.keys, starts, side='left')
+        hi = np.searchsorted(self.keys, stops, side='left')
+        return concat_ranges(lo, hi), self.offsets[hi] - self.offsets[lo]
+
+    def lookup_ranges(self, starts, stops):
+        """返回键落在任一 [start, stop) 区间内的 fid（去重）"""
+        list_ids, _ = self._lists(starts, stops)
+        return np.unique(self._decode_lists(list_ids))
+
+    def lookup_ranges_batch(self, query_ids, starts, stops, n_queries):
+        """批量区间查找，返回按查询号分组去重后的 CSR 结构 (offsets, fids)"""
+        list_ids, counts = self._lists(starts, stops)
+        return group_unique(np.repeat(query_ids, counts),
+                            self._decode_lists(list_ids), n_queries)
+
+    def to_arrays(self):
+        """导出为待写入索引文件的数组字典"""
+        if self.data is None:
+            return {
+                'keys': self.keys,
+                'offsets': self.offsets,
+                'fids': self.fids
+            }
+        return {
+            'keys': self.keys,
+            'offsets': self.offsets,
+            'data': self.data,
+            'byte_offsets': self.byte_offsets
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """由索引文件中的数组（零拷贝视图）恢复"""
+        return cls(arrays['keys'],
+                   arrays['offsets'],
+                   fids=arrays.get('fids'),
+                   data=arrays.get('data'),
+                   byte_offsets=arrays.get('byte_offsets'))
+
+    def to_dict(self, keys=None):
+        """展开为 键 -> fid 列表 的字典，keys 可传入转换后的键（如字符串）"""
+        keys = self.keys.tolist() if keys is None else keys
+        fids = self._decode_lists(np.arange(len(self.keys))).tolist()
+        offsets = self.offsets.tolist()
+        return {
+            key: fids[offsets[i]:offsets[i + 1]]
+            for i, key in enumerate(keys)
+        }
+
+
+def check_storage(storage, compression=None):
+    """校验引擎构造参数中的存储方式与压缩方式"""
+    if storage not in STORAGES:
+        raise ValueError(f"不支持的存储方式: {storage}")
+    if compression is not None and storage != 'csr':
+        raise ValueError("仅 csr 存储支持压缩")
+
+
+def build_postings(storage, keys, fids, key_dtype=np.int64, compression=None):
+    """按存储方式构建数组倒排表：sorted 为 SortedPostings，csr 为 CSRPostings"""
+    if storage == 'csr':
+        return CSRPostings.from_pairs(keys, fids, key_dtype, compression)
+    return SortedPostings.from_pairs(keys, fids, key_dtype)
+
+
+def postings_from_arrays(storage, arrays):
+    """由索引文件中的数组恢复 build_postings 构建的倒排表"""
+    if storage == 'csr':
+        return CSRPostings.from_arrays(arrays)
+    return SortedPostings.from_arrays(arrays)
+
+
+def dict_to_csr(index, keys=None, key_dtype=np.int64):
+    """将 键 -> fid 列表 的字典转换为 CSRPostings，keys 为转换后的整数键"""
+    lists = list(index.values())
+    keys = list(index.keys()) if keys is None else keys
+    lengths = [len(fids) for fids in lists]
+    return CSRPostings.from_pairs(np.repeat(np.asarray(keys, dtype=key_dtype),
+                                            lengths),
+                                  np.fromiter(chain.from_iterable(lists),
+                                              dtype=np.int64,
+                                              count=sum(lengths)),
+                                  key_dtype=key_dtype)
+
+
+def pairs_to_dict(keys, fids, key_dtype=np.int64, key_func=None):
+    """由无序的 (key, fid) 对构建 键 -> fid 列表 的字典
+
+    key_func 用于把排序后的整数键数组转换为字典键（如 H3/GeoHash 字符串）。
+    """
+    csr = CSRPostings.from_pairs(keys, fids, key_dtype)
+    keys = None if key_func is None else key_func(csr.keys)
+    return defaultdict(list, csr.to_dict(keys))
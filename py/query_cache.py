@@ -0,0 +1,104 @@
+# query_cache.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import math
+import time
+from collections import OrderedDict
+
+# 每个缓存条目除数组本身外的估计开销（键、元组、字典槽位）
+ENTRY_OVERHEAD = 200
+
+
+def snap_bbox(bbox, snap):
+    """将 bbox 向外对齐到 snap 度的格网，snap 为 0 时原样返回"""
+    min_x, min_y, max_x, max_y = map(float, bbox)
+    if not snap:
+        return (min_x, min_y, max_x, max_y)
+    return (math.floor(min_x / snap) * snap, math.floor(min_y / snap) * snap,
+            math.ceil(max_x / snap) * snap, math.ceil(max_y / snap) * snap)
+
+
+class QueryCache:
+    """查询候选结果的 LRU/TTL 缓存
+
+    键为按 snap 外扩对齐后的 bbox，值为该 bbox 的候选 fid 数组（只读）。
+    外扩后的 bbox 包含原 bbox，其候选集也包含原 bbox 的全部命中，
+    因此微小平移的视口可以共用同一条目，再由精确验证裁剪到原 bbox。
+    """
+
+    def __init__(self,
+                 max_entries=1024,
+                 max_bytes=64 * 1024 * 1024,
+                 ttl=None,
+                 snap=0.0):
+        # 条目数上限与内存预算（字节），超出时淘汰最久未使用的条目
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # 条目存活秒数，None 表示不过期
+        self.ttl = ttl
+        # bbox 对齐的格网大小（度），0 表示不对齐，只有完全相同的 bbox 才命中
+        self.snap = snap
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, bbox):
+        """计算 bbox 的缓存键：向外对齐到 snap 格网"""
+        return snap_bbox(bbox, self.snap)
+
+    def get(self, key):
+        """命中时返回候选数组并记为最近使用，否则返回 None"""
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and \
+                time.monotonic() - entry[1] > self.ttl:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, fids):
+        """写入条目，超过条目数或内存预算时按 LRU 淘汰"""
+        size = fids.nbytes + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        fids.flags.writeable = False
+        self._entries[key] = (fids, time.monotonic(), size)
+        self.nbytes += size
+        while len(self._entries) > self.max_entries or \
+                self.nbytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.nbytes -= size
+
+    def clear(self):
+        """清空全部条目（索引重建、加载或修改后调用），计数器保留"""
+        self._entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0
+        }
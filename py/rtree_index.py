@@ -6,64 +6,71 @@
 
 from rtree import index
 from index_base import SpatialIndex
-import pickle
+import numpy as np
 import os
 import time
 from osgeo import ogr
 
+# libspatialindex 磁盘索引的两个文件
+DISK_EXTENSIONS = ('dat', 'idx')
+
+
+def disk_files_exist(prefix):
+    return prefix is not None and all(
+        os.path.exists(f'{prefix}.{ext}') for ext in DISK_EXTENSIONS)
+
 
 class RtreeIndex(SpatialIndex):
 
+    ENGINE = 'rtree'
+
     def __init__(self,
                  data_path,
-                 index_file='./index_py/rtree.pkl',
-                 resolution=None):
-        super().__init__(data_path, index_file, resolution)
+                 index_file='./index_py/rtree.spx',
+                 resolution=None,
+                 leaf_capacity=100,
+                 fill_factor=0.7,
+                 backend='memory',
+                 pagesize=4096,
+                 buffering_capacity=10,
+                 workers=1):
+        super().__init__(data_path, index_file, resolution, workers)
+        if backend not in ('memory', 'disk'):
+            raise ValueError(f"不支持的 R 树后端: {backend}")
         self.rtree_idx = None
         self.rtree_index_file = index_file
-        self.feature_bounds = {}  # 存储要素的外包矩形用于精确验证
-        self.feature_count = 0  # 要素总数
+        # STR 批量装载参数：叶节点容量与节点填充率
+        self.leaf_capacity = leaf_capacity
+        self.fill_factor = fill_factor
+        # memory: 每次加载时由外包矩形重新装载；
+        # disk: 使用 libspatialindex 原生的 .dat/.idx 文件，加载时直接打开，
+        #       多个查询进程可共享同一份文件
+        self.backend = backend
+        # disk 后端的页大小（字节）与内存页缓冲数量
+        self.pagesize = pagesize
+        self.buffering_capacity = buffering_capacity
+        # disk 后端当前打开的 .dat/.idx 前缀（绝对路径），写入文件头部；
+        # attach_shared() 挂载时即为导出方的文件
+        self.disk_prefix = None
 
         ogr.RegisterAll()
 
         if os.path.exists(index_file):
-            print("从pkl加载R树索引...")
+            print("加载已有的 R 树索引...")
             self.load_index()
         else:
             print("R 树索引文件不存在，请调用 build_index() 构建索引")
 
-    def build_index(self):
-        """构建或重建 R 树索引"""
+    def _build_from_bounds(self, bounds):
+        """由已提取的外包矩形构建或重建 R 树索引"""
         start_time = time.time()
 
-        datasource = ogr.Open(self.data_path)
-        layer = datasource.GetLayer()
-        self.feature_count = layer.GetFeatureCount()
+        self.feature_bounds = bounds
+        self.feature_count = len(self.feature_bounds)
         print(f"开始构建 R 树索引，共 {self.feature_count} 个要素...")
 
-        # 初始化 R 树索引（仅内存中）
-        rtree_properties = index.Property()
-        rtree_properties.dimension = 2
-        self.rtree_idx = index.Index(properties=rtree_properties)
-
-        self.feature_bounds = {}  # 清空旧的边界信息
-
-        for feature in layer:
-            fid = feature.GetFID()
-            geom = feature.GetGeometryRef()
-            if not geom:
-                continue
-
-            # 获取外包矩形
-            env = geom.GetEnvelope()
-            min_lon, max_lon, min_lat, max_lat = env
-            bounds = (min_lon, min_lat, max_lon, max_lat)
-            self.feature_bounds[fid] = bounds
-
-        # 构建 R 树索引
-        for fid, bounds in self.feature_bounds.items():
-            minx, miny, maxx, maxy = bounds
-            self.rtree_idx.insert(fid, (minx, miny, maxx, maxy))
+        # 由外包矩形数组批量装载 R 树
+        self.rtree_idx = self._bulk_load()
 
         # 保存 R 树索引到文件
         self.save_index()
@@ -71,64 +78,127 @@ class RtreeIndex(SpatialIndex):
         print(f"索引构建完成! 耗时: {time.time() - start_time:.2f}秒")
         print(f"R树条目: {len(self.feature_bounds)}")
 
-    def query_by_bbox(self, bbox):
-        """基于 BBox 查询要素"""
-        start_time = time.time()
-        if not self.rtree_idx:
+    def _rtree_properties(self):
+        rtree_properties = index.Property()
+        rtree_properties.dimension = 2
+        rtree_properties.leaf_capacity = self.leaf_capacity
+        rtree_properties.fill_factor = self.fill_factor
+        rtree_properties.pagesize = self.pagesize
+        rtree_properties.buffering_capacity = self.buffering_capacity
+        return rtree_properties
+
+    def _open_disk(self, prefix):
+        """打开已有的 .dat/.idx 索引文件"""
+        self.disk_prefix = prefix
+        return index.Index(prefix, properties=self._rtree_properties())
+
+    def _flush_disk(self):
+        """关闭以写出页缓冲中的全部节点，再重新打开"""
+        self.rtree_idx.close()
+        self.rtree_idx = self._open_disk(self.disk_prefix)
+
+    def _bulk_load(self):
+        """以 STR（Sort-Tile-Recursive）方式由外包矩形数组批量装载 R 树"""
+        rtree_properties = self._rtree_properties()
+        # disk 后端写入 <file_prefix>.dat/.idx，覆盖已有文件
+        args = ()
+        if self.backend == 'disk':
+            if self.rtree_idx is not None:
+                self.rtree_idx.close()
+            os.makedirs(os.path.dirname(self.index_file) or '.',
+                        exist_ok=True)
+            self.disk_prefix = os.path.abspath(self.file_prefix)
+            args = (self.disk_prefix, )
+
+        bounds = self.feature_bounds
+        if not len(bounds):
+            return index.Index(*args,
+                               properties=rtree_properties,
+                               overwrite=True)
+
+        mins = np.ascontiguousarray(bounds.boxes[:2].T)
+        maxs = np.ascontiguousarray(bounds.boxes[2:].T)
+        try:
+            return index.Index(*args, (np.asarray(bounds.fids), mins, maxs),
+                               properties=rtree_properties,
+                               overwrite=True)
+        except NotImplementedError:
+            # libspatialindex < 2.1 不支持数组装载，退回到流式批量装载
+            stream = ((fid, (minx, miny, maxx, maxy), None)
+                      for fid, minx, miny, maxx, maxy in bounds.iter_rows())
+            return index.Index(*args,
+                               stream,
+                               properties=rtree_properties,
+                               overwrite=True)
+
+    def _query_candidates(self, bbox):
+        """由 R 树获取候选要素，R 树本身即按外包矩形相交判断"""
+        if self.rtree_idx is None:
             raise RuntimeError("R树索引未加载，请先调用 build_index() 或 load_index()")
 
-        # 使用 R 树查询
-        candidate_fids = list(self.rtree_idx.intersection(bbox))
+        return np.fromiter(self.rtree_idx.intersection(bbox), dtype=np.int64)
 
-        results = candidate_fids
+    def _query_candidates_batch(self, bboxes):
+        """批量相交查询，一次调用完成全部 bbox"""
+        if self.rtree_idx is None:
+            raise RuntimeError("R树索引未加载，请先调用 build_index() 或 load_index()")
 
-        duration = (time.time() - start_time) * 1000
-        print(f"查询完成! 耗时: {duration:.2f}ms")  # 占位，实际由测试类统计
-        print(f"候选要素: {len(candidate_fids)}")
-        return results
+        fids, counts = self.rtree_idx.intersection_v(bboxes[:, :2],
+                                                     bboxes[:, 2:])
+        offsets = np.zeros(len(bboxes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return offsets, fids.astype(np.int64, copy=False)
+
+    def _index_meta(self):
+        return {
+            'backend': self.backend,
+            'leaf_capacity': self.leaf_capacity,
+            'fill_factor': self.fill_factor,
+            'pagesize': self.pagesize,
+            'buffering_capacity': self.buffering_capacity,
+            'file_prefix': self.disk_prefix
+        }
+
+    def _restore_index(self, meta, arrays):
+        self.backend = meta['backend']
+        self.leaf_capacity = meta['leaf_capacity']
+        self.fill_factor = meta['fill_factor']
+        self.pagesize = meta['pagesize']
+        self.buffering_capacity = meta['buffering_capacity']
+        if self.backend == 'disk':
+            # 优先打开头部记录的文件（共享内存挂载时即导出方的文件，
+            # 挂载方只读取、不修改），索引文件连同 .dat/.idx 一起移动过时
+            # 打开索引文件旁的文件
+            prefixes = (meta['file_prefix'], os.path.abspath(self.file_prefix))
+            prefix = next((p for p in prefixes if disk_files_exist(p)), None)
+            if prefix is not None:
+                # 直接打开原生索引文件，不做任何重建
+                self.rtree_idx = self._open_disk(prefix)
+            else:
+                # 打开不存在的文件会得到一棵空树，改为由外包矩形重新装载
+                print("R 树 .dat/.idx 文件缺失，由外包矩形重新装载...")
+                self.rtree_idx = self._bulk_load()
+                self._flush_disk()
+        else:
+            # 由外包矩形数组批量装载，无需逐条插入
+            self.rtree_idx = self._bulk_load()
 
     def load_index(self):
-        """从pickle文件加载R树索引"""
-        pkl_file = self.index_file
-        if not os.path.exists(pkl_file):
-            print("R树索引pkl文件不存在")
-            return
-
-        with open(pkl_file, 'rb') as f:
-            loaded_data = pickle.load(f)
-            all_entries = loaded_data['entries']
-            self.feature_bounds = loaded_data.get('feature_bounds', {})
-
-        # 创建新的R树索引
-        rtree_properties = index.Property()
-        rtree_properties.dimension = 2
-        self.rtree_idx = index.Index(properties=rtree_properties)
-
-        # 重新插入所有条目
-        for fid, bounds in all_entries:
-            self.rtree_idx.insert(fid, bounds)
-
+        """从索引文件加载R树索引"""
+        self.read_index()
         print("R树索引加载完成")
 
     def save_index(self):
-        """将R树索引保存为pickle文件"""
+        """将R树参数与外包矩形写入索引文件"""
         if self.rtree_idx is None:
             print("没有可用的R树索引")
             return
 
-        # 收集所有条目
-        all_entries = []
-        for fid in self.feature_bounds.keys():
-            bounds = self.feature_bounds[fid]
-            all_entries.append((fid, bounds))
-
-        # 保存到 .pkl 文件
-        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
-        with open(self.index_file, 'wb') as f:
-            pickle.dump(
-                {
-                    'entries': all_entries,
-                    'feature_bounds': self.feature_bounds
-                }, f)
+        # 外包矩形即为全部条目；disk 后端的树结构已在 .dat/.idx 中
+        # 打开的是其他进程的文件（共享内存挂载）时不写回
+        if self.backend == 'disk' and self.disk_prefix == os.path.abspath(
+                self.file_prefix):
+            self._flush_disk()
+        self.write_index()
 
         print("R树索引保存完成")
@@ -7,10 +7,12 @@
 from typing import Dict
 from index_base import SpatialIndex
 from index_tester import IndexTester
+from index_builder import IndexBuilder
 from rtree_index import RtreeIndex
 from geohash_index import GeoHashSpatialIndex
 from s2_index import S2SpatialIndex
 from h3_index import H3SpatialIndex
+from synthetic_data import generate_dataset
 
 import os
 
@@ -21,6 +23,12 @@ if __name__ == "__main__":
     test_data = "/home/chenming/Data/GIS_DATA/shapefile/dltb_532300_2020.shp"
     sample_bbox = (100.546875, 25.3125, 101.25, 26.015625)
 
+    # 本机没有上述数据时使用可复现的合成数据（同一区域、城市分布的多边形）
+    if not os.path.exists(test_data):
+        test_data = "./data/synthetic_100000.gpkg"
+        if not os.path.exists(test_data):
+            generate_dataset(test_data, 100000, 'polygon', 'city')
+
     indexers: Dict[str, SpatialIndex] = {
         "Rtree": RtreeIndex(test_data),
         "GeoHash": GeoHashSpatialIndex(test_data, precision=7),
@@ -28,14 +36,17 @@ if __name__ == "__main__":
         # "H3": H3SpatialIndex(test_data, resolution=10),
     }
 
-    # 检查并加载或构建索引
+    # 已有索引文件的引擎在构造时已加载，其余引擎共用一次数据扫描构建
+    builder = IndexBuilder(test_data)
     for name, idx in indexers.items():
-        if hasattr(idx, 'index_file') and os.path.exists(idx.index_file):
-            print(f"Loading existing {name} index...")
-            idx.load_index()
-        else:
-            print(f"Building {name} index...")
-            idx.build_index()
+        builder.register(name, idx)
+    missing = [
+        name for name, idx in indexers.items()
+        if not os.path.exists(idx.index_file)
+    ]
+    builder.build(missing)
+    # 已加载的索引若数据源有变化，共用一次扫描，只把变化的要素写入增量层
+    builder.refresh([name for name in indexers if name not in missing])
 
     tester = IndexTester(test_data, sample_bbox)
     tester.run_performance_test(indexers, visualize=True)
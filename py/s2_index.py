@@ -5,24 +5,81 @@
 #
 
 import s2sphere
-from index_base import SpatialIndex
-import pickle
+from index_base import (SpatialIndex, pack_arrays, unpack_arrays,
+                        cover_bounds)
+from postings import (build_postings, postings_from_arrays, dict_to_csr,
+                      pairs_to_dict, merge_postings, check_storage)
+import numpy as np
 import os
 import time
+from array import array
 from collections import defaultdict
+from functools import partial
+from itertools import chain
 from osgeo import ogr
 
 
+def build_coverer(resolution, min_level=None, max_cells=8):
+    """建索引使用的覆盖器，同一块内的所有要素共用一个"""
+    coverer = s2sphere.RegionCoverer()
+    coverer.max_level = resolution
+    if min_level is None:
+        coverer.min_level = resolution
+    else:
+        coverer.min_level = min_level
+        coverer.max_cells = max_cells
+    return coverer
+
+
+def bounds_to_s2_cells(bounds, resolution, min_level=None, max_cells=8):
+    """计算一块要素外包矩形的 S2 覆盖，返回 (uint64 单元格 id, fid) 数组"""
+    coverer = build_coverer(resolution, min_level, max_cells)
+    keys, fids = array('Q'), array('q')
+    for fid, min_lon, min_lat, max_lon, max_lat in bounds.iter_rows():
+        # 构建 S2 单元格
+        p1 = s2sphere.LatLng.from_degrees(min_lat, min_lon)
+        p2 = s2sphere.LatLng.from_degrees(max_lat, max_lon)
+        rect = s2sphere.LatLngRect.from_point_pair(p1, p2)
+
+        cell_ids = coverer.get_covering(rect)
+        keys.extend(cell.id() for cell in cell_ids)
+        fids.extend([fid] * len(cell_ids))
+    return (np.frombuffer(keys, dtype=np.uint64),
+            np.frombuffer(fids, dtype=np.int64))
+
+
 class S2SpatialIndex(SpatialIndex):
 
+    ENGINE = 's2'
+
     def __init__(self,
                  data_path,
-                 index_file='./index_py/s2.pkl',
-                 resolution=15):
-        super().__init__(data_path, index_file, resolution)
+                 index_file='./index_py/s2.spx',
+                 resolution=15,
+                 storage='dict',
+                 max_query_cells=32,
+                 min_level=None,
+                 max_cells=8,
+                 compression=None,
+                 workers=1):
+        super().__init__(data_path, index_file, resolution, workers)
+        check_storage(storage, compression)
+        if min_level is not None and storage == 'dict':
+            raise ValueError("多层级覆盖需要 sorted 或 csr 存储")
+        # dict: 单元格 id -> fid 列表；
+        # sorted: 按单元格 id 排序的 uint64 数组与对应 fid 数组，
+        #         任意层级的查询单元格都可按 [range_min, range_max] 区间查找
+        # csr: 同样以 uint64 单元格 id 为键，倒排表为 CSR 结构，可选 varint 压缩
+        self.storage = storage
+        self.compression = compression
+        # 数组存储下查询覆盖的最大单元格数
+        self.max_query_cells = max_query_cells
+        # 建索引时的覆盖方式：min_level 为 None 时所有要素固定使用 resolution
+        # 层级；否则在 [min_level, resolution] 之间按 max_cells 自适应选择层级，
+        # 大要素用粗单元格，小要素用细单元格
+        self.min_level = min_level
+        self.max_cells = max_cells
         self.s2_index = defaultdict(list)
-        self.feature_bounds = {}  # 存储要素的外包矩形用于精确验证
-        self.feature_count = 0  # 要素总数
 
         ogr.RegisterAll()
 
@@ -32,53 +89,38 @@ class S2SpatialIndex(SpatialIndex):
         else:
             print("S2 索引文件不存在，请调用 build_index() 构建索引")
 
-    def build_index(self):
-        """构建或重建 S2 空间索引"""
+    def _build_from_bounds(self, bounds):
+        """由已提取的外包矩形构建或重建 S2 空间索引"""
         start_time = time.time()
 
-        datasource = ogr.Open(self.data_path)
-        layer = datasource.GetLayer()
-        self.feature_count = layer.GetFeatureCount()
+        self.feature_bounds = bounds
+        self.feature_count = len(self.feature_bounds)
         print(f"开始构建 S2 索引，共 {self.feature_count} 个要素...")
 
-        self.s2_index.clear()
-        feature_bounds = []
-
-        for feature in layer:
-            fid = feature.GetFID()
-            geom = feature.GetGeometryRef()
-            if not geom:
-                continue
-
-            # 获取外包矩形
-            env = geom.GetEnvelope()
-            min_lon, max_lon, min_lat, max_lat = env
-            bounds = (min_lon, min_lat, max_lon, max_lat)
-            self.feature_bounds[fid] = bounds
-            feature_bounds.append((fid, bounds))
-
-            # 构建 S2 单元格
-            p1 = s2sphere.LatLng.from_degrees(min_lat, min_lon)
-            p2 = s2sphere.LatLng.from_degrees(max_lat, max_lon)
-            rect = s2sphere.LatLngRect.from_point_pair(p1, p2)
-
-            coverer = s2sphere.RegionCoverer()
-            coverer.min_level = self.resolution
-            coverer.max_level = self.resolution
-
-            cell_ids = coverer.get_covering(rect)
-            for cell in cell_ids:
-                self.s2_index[cell.id()].append(fid)
+        # 各进程分块计算覆盖，返回的 (单元格, fid) 数组在主进程合并
+        keys, fids = cover_bounds(
+            partial(bounds_to_s2_cells,
+                    resolution=self.resolution,
+                    min_level=self.min_level,
+                    max_cells=self.max_cells), self.feature_bounds,
+            self.workers, self.pool)
+        if self.storage != 'dict':
+            self.s2_index = build_postings(self.storage,
+                                           keys,
+                                           fids,
+                                           key_dtype=np.uint64,
+                                           compression=self.compression)
+        else:
+            self.s2_index = pairs_to_dict(keys, fids, key_dtype=np.uint64)
 
         # 保存 S2 索引
         self.save_index()
 
         print(f"索引构建完成! 耗时: {time.time() - start_time:.2f}秒")
-        print(f"S2索引条目: {len(self.s2_index)}, R树条目: {len(feature_bounds)}")
+        print(f"S2索引条目: {len(self.s2_index)}, 外包矩形: {len(self.feature_bounds)}")
 
-    def query_by_bbox(self, bbox):
-        """基于 BBox 查询要素"""
-        start_time = time.time()
+    def _query_covering(self, bbox):
+        """计算查询区域的 S2 单元格覆盖"""
         min_lon, min_lat, max_lon, max_lat = bbox
 
         # 构建查询区域的 S2 单元格
@@ -87,38 +129,104 @@ class S2SpatialIndex(SpatialIndex):
         query_rect = s2sphere.LatLngRect.from_point_pair(p1, p2)
 
         coverer = s2sphere.RegionCoverer()
-        coverer.min_level = self.resolution
-        query_cells = coverer.get_covering(query_rect)
+        coverer.max_level = self.resolution
+        if self.storage != 'dict':
+            # 允许较粗的单元格，由区间查找覆盖其全部子单元格
+            coverer.max_cells = self.max_query_cells
+        else:
+            # 字典只能精确匹配索引层级的单元格
+            coverer.min_level = self.resolution
+        return coverer.get_covering(query_rect)
+
+    def _query_ranges(self, bbox):
+        """查询单元格对应的 id 查找区间
+
+        每个查询单元格贡献两类区间：
+        - [range_min, range_max + 1)：命中它自身及全部子孙单元格；
+        - 多层级索引下，它在 [min_level, level) 各层的祖先单元格，
+          以 [id, id + 1) 精确匹配。
+        """
+        min_level = self.resolution if self.min_level is None \
+            else self.min_level
+        starts, stops = [], []
+        for cell in self._query_covering(bbox):
+            starts.append(cell.range_min().id())
+            stops.append(cell.range_max().id() + 1)
+            for level in range(min_level, cell.level()):
+                parent_id = cell.parent(level).id()
+                starts.append(parent_id)
+                stops.append(parent_id + 1)
+        return (np.array(starts, dtype=np.uint64),
+                np.array(stops, dtype=np.uint64))
+
+    def _query_candidates(self, bbox):
+        """由 S2 单元格获取候选要素"""
+        if self.storage != 'dict':
+            return self.s2_index.lookup_ranges(
+                *self._covering(self._query_ranges, bbox))
 
-        # 获取候选要素
         candidate_fids = set()
-        for cell in query_cells:
+        for cell in self._covering(self._query_covering, bbox):
             candidate_fids.update(self.s2_index.get(cell.id(), []))
 
-        candidate_fids = list(candidate_fids)
-
-        results = candidate_fids
-
-        duration = (time.time() - start_time) * 1000
-        print(f"查询完成! 耗时: {duration:.2f}ms")  # 占位，实际由测试类统计
-        print(f"候选要素: {len(candidate_fids)}")
-        return results
+        return np.fromiter(candidate_fids,
+                           dtype=np.int64,
+                           count=len(candidate_fids))
+
+    def _query_candidates_batch(self, bboxes):
+        """先计算全部查询的覆盖单元格，再统一合并倒排表"""
+        if not len(bboxes):
+            return np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if self.storage != 'dict':
+            return self._lookup_ranges_batch(self.s2_index,
+                                             self._query_ranges, bboxes)
+
+        coverings = [
+            self._covering(self._query_covering, bbox)
+            for bbox in bboxes.tolist()
+        ]
+        query_ids = np.repeat(np.arange(len(coverings)),
+                              [len(cells) for cells in coverings])
+        cells = np.array(
+            [cell.id() for cell in chain.from_iterable(coverings)],
+            dtype=np.uint64)
+        return merge_postings(self.s2_index, query_ids, cells, len(bboxes))
+
+    def _index_meta(self):
+        return {
+            'storage': self.storage,
+            'compression': self.compression,
+            'min_level': self.min_level,
+            'max_cells': self.max_cells
+        }
+
+    def _index_arrays(self):
+        if self.storage != 'dict':
+            return pack_arrays('postings', self.s2_index.to_arrays())
+        # 字典存储同样以 CSR 数组写入，加载时再展开为字典
+        return pack_arrays(
+            'postings',
+            dict_to_csr(self.s2_index, key_dtype=np.uint64).to_arrays())
+
+    def _restore_index(self, meta, arrays):
+        self.storage = meta['storage']
+        self.compression = meta['compression']
+        self.min_level = meta['min_level']
+        self.max_cells = meta['max_cells']
+        postings = postings_from_arrays(
+            'csr' if self.storage == 'dict' else self.storage,
+            unpack_arrays(arrays, 'postings'))
+        if self.storage != 'dict':
+            self.s2_index = postings
+        else:
+            self.s2_index = defaultdict(list, postings.to_dict())
 
     def load_index(self):
-        """从pickle文件加载S2索引"""
-        with open(self.index_file, 'rb') as f:
-            loaded_data = pickle.load(f)
-            if isinstance(loaded_data, dict):
-                self.s2_index = loaded_data
-            else:
-                raise ValueError("加载的S2索引格式不正确")
-
+        """从索引文件加载S2索引（内存映射）"""
+        self.read_index()
         print("S2索引加载完成")
 
     def save_index(self):
-        """将S2索引保存为pickle文件"""
-        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
-        with open(self.index_file, 'wb') as f:
-            pickle.dump(dict(self.s2_index), f)
-
+        """将S2索引与外包矩形写入索引文件"""
+        self.write_index()
         print("S2索引保存完成")
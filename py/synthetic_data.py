@@ -0,0 +1,181 @@
+# synthetic_data.py
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import argparse
+import os
+import time
+
+import numpy as np
+import shapely
+from pyogrio.raw import write
+
+# 默认生成范围（度），与测试数据所在区域相近
+DEFAULT_EXTENT = (97.5, 21.0, 106.5, 29.5)
+
+GEOMETRY_TYPES = {
+    'point': 'Point',
+    'line': 'LineString',
+    'polygon': 'Polygon'
+}
+DISTRIBUTIONS = ('uniform', 'clustered', 'city')
+SIZE_DISTRIBUTIONS = ('fixed', 'exponential', 'lognormal')
+
+WGS84 = 'EPSG:4326'
+
+
+def cluster_centers(extent, clusters, rng):
+    """随机生成聚集中心（或城市中心），所有批次共用"""
+    min_x, min_y, max_x, max_y = extent
+    return (rng.uniform(min_x, max_x, clusters),
+            rng.uniform(min_y, max_y, clusters))
+
+
+def sample_centers(n, extent, distribution, rng, centers=None, spread=0.05):
+    """按空间分布生成 n 个要素中心点，返回 (x, y)
+
+    uniform 在范围内均匀分布；clustered 围绕 centers 按正态分布聚集，
+    spread 为标准差（范围宽高的比例）；city 模拟城市：城市规模服从 Zipf
+    分布，要素到城市中心的距离为重尾分布，少数城市集中了大部分要素。
+    """
+    min_x, min_y, max_x, max_y = extent
+    width, height = max_x - min_x, max_y - min_y
+    if distribution == 'uniform':
+        x = rng.uniform(min_x, max_x, n)
+        y = rng.uniform(min_y, max_y, n)
+    elif distribution == 'clustered':
+        cx, cy = centers
+        k = rng.integers(0, len(cx), n)
+        x = cx[k] + rng.normal(0, spread * width, n)
+        y = cy[k] + rng.normal(0, spread * height, n)
+    elif distribution == 'city':
+        cx, cy = centers
+        weights = 1.0 / np.arange(1, len(cx) + 1)
+        k = rng.choice(len(cx), n, p=weights / weights.sum())
+        # 城市中心密集、向外逐渐稀疏
+        radius = rng.pareto(2.0, n) * spread * 0.2 * min(width, height)
+        angle = rng.uniform(0, 2 * np.pi, n)
+        x = cx[k] + radius * np.cos(angle)
+        y = cy[k] + radius * np.sin(angle)
+    else:
+        raise ValueError(f"不支持的空间分布: {distribution}")
+    return np.clip(x, min_x, max_x), np.clip(y, min_y, max_y)
+
+
+def sample_sizes(n, size, size_distribution, rng):
+    """生成 n 个要素尺寸（度），均值约为 size"""
+    if size_distribution == 'fixed':
+        return np.full(n, float(size))
+    if size_distribution == 'exponential':
+        return rng.exponential(size, n)
+    if size_distribution == 'lognormal':
+        # sigma=1 时均值为 exp(mu + 0.5)，使均值等于 size
+        return rng.lognormal(np.log(size) - 0.5, 1.0, n)
+    raise ValueError(f"不支持的尺寸分布: {size_distribution}")
+
+
+def make_geometries(x, y, sizes, geometry_type, rng, vertices=8):
+    """由中心点与尺寸批量构造几何
+
+    line 为从中心出发、总长约为 size 的 vertices 个顶点的随机折线；
+    polygon 为以中心点为中心、宽高在 size 附近随机浮动的矩形。
+    """
+    n = len(x)
+    if geometry_type == 'point':
+        return shapely.points(x, y)
+    if geometry_type == 'line':
+        step = sizes / (vertices - 1)
+        heading = rng.uniform(0, 2 * np.pi, n)[:, None] + \
+            np.cumsum(rng.normal(0, 0.5, (n, vertices - 1)), axis=1)
+        dx = np.cumsum(step[:, None] * np.cos(heading), axis=1)
+        dy = np.cumsum(step[:, None] * np.sin(heading), axis=1)
+        coords = np.empty((n, vertices, 2))
+        coords[:, 0, 0], coords[:, 0, 1] = x, y
+        coords[:, 1:, 0] = x[:, None] + dx
+        coords[:, 1:, 1] = y[:, None] + dy
+        return shapely.linestrings(coords)
+    if geometry_type == 'polygon':
+        half_w = sizes * rng.uniform(0.25, 0.75, n)
+        half_h = sizes * rng.uniform(0.25, 0.75, n)
+        return shapely.box(x - half_w, y - half_h, x + half_w, y + half_h)
+    raise ValueError(f"不支持的几何类型: {geometry_type}")
+
+
+def generate_dataset(path,
+                     count,
+                     geometry_type='polygon',
+                     distribution='uniform',
+                     size=0.001,
+                     size_distribution='lognormal',
+                     extent=DEFAULT_EXTENT,
+                     clusters=20,
+                     seed=0,
+                     batch_size=1000000,
+                     layer=None):
+    """生成合成矢量数据并写入 path（按扩展名选择 GeoPackage 或 Shapefile）
+
+    要素按 batch_size 分批生成、追加写入，内存占用与总数无关，可生成
+    1e7 级别的数据。相同参数与 seed 生成的数据完全一致。
+    属性字段：id（从 0 开始的序号）与 size（尺寸，度）。
+    """
+    if geometry_type not in GEOMETRY_TYPES:
+        raise ValueError(f"不支持的几何类型: {geometry_type}")
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"不支持的空间分布: {distribution}")
+    if size_distribution not in SIZE_DISTRIBUTIONS:
+        raise ValueError(f"不支持的尺寸分布: {size_distribution}")
+    count = int(count)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    layer = layer or os.path.splitext(os.path.basename(path))[0]
+
+    start_time = time.time()
+    rng = np.random.default_rng(seed)
+    centers = cluster_centers(extent, clusters, rng)
+    for offset in range(0, count, batch_size):
+        n = min(batch_size, count - offset)
+        x, y = sample_centers(n, extent, distribution, rng, centers)
+        sizes = sample_sizes(n, size, size_distribution, rng)
+        geometries = make_geometries(x, y, sizes, geometry_type, rng)
+        ids = np.arange(offset, offset + n, dtype=np.int64)
+        write(path,
+              shapely.to_wkb(geometries),
+              [ids, sizes],
+              ['id', 'size'],
+              layer=layer,
+              geometry_type=GEOMETRY_TYPES[geometry_type],
+              crs=WGS84,
+              append=offset > 0)
+        print(f"已写入 {offset + n}/{count} 个要素")
+
+    print(f"合成数据生成完成: {path}, 耗时: {time.time() - start_time:.2f}秒")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成矢量测试数据")
+    parser.add_argument('path', help="输出路径（.gpkg 或 .shp）")
+    parser.add_argument('--count', type=float, default=1e5)
+    parser.add_argument('--geometry', choices=list(GEOMETRY_TYPES),
+                        default='polygon')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS,
+                        default='uniform')
+    parser.add_argument('--size', type=float, default=0.001,
+                        help="要素平均尺寸（度）")
+    parser.add_argument('--size-distribution', choices=SIZE_DISTRIBUTIONS,
+                        default='lognormal')
+    parser.add_argument('--extent', default=','.join(map(str, DEFAULT_EXTENT)),
+                        help="min_x,min_y,max_x,max_y")
+    parser.add_argument('--clusters', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_dataset(args.path, args.count, args.geometry, args.distribution,
+                     args.size, args.size_distribution,
+                     tuple(float(v) for v in args.extent.split(',')),
+                     args.clusters, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'py'))
+
+from index_base import FeatureBounds
+
+BBOX = (100.2, 25.2, 100.4, 25.4)
+
+
+def test_intersects_empty_store():
+    """空的外包矩形存储中任何 fid 都判为不相交"""
+    bounds = FeatureBounds()
+    assert bounds.intersects([0, 5], BBOX).tolist() == [False, False]
+    assert bounds.intersects(np.empty(0, dtype=np.int64), BBOX).size == 0
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    from synthetic_data import generate_dataset
+    path = str(tmp_path / 'data.gpkg')
+    generate_dataset(path, 200, 'polygon', size=0.05,
+                     extent=(100.0, 25.0, 100.5, 25.5))
+    return path
+
+
+def test_delete_only_delta(dataset, tmp_path):
+    """只有删除的增量层（增量外包矩形为空）下精确验证查询不报错"""
+    pytest.importorskip('osgeo')
+    from geohash_index import GeoHashSpatialIndex
+    engine = GeoHashSpatialIndex(dataset, str(tmp_path / 'gh.spx'),
+                                 precision=5)
+    engine.build_index()
+    before = sorted(engine.query_by_bbox(BBOX, exact_check=True))
+    assert before
+
+    engine.delete(before[0])
+    assert engine.has_delta and not len(engine.delta_bounds)
+    assert sorted(engine.query_by_bbox(BBOX, exact_check=True)) == before[1:]
+    assert before[0] not in engine.query_by_bbox(BBOX, geometry_check=True)
+    offsets, fids = engine.query_by_bboxes([BBOX], exact_check=True)
+    assert sorted(fids.tolist()) == before[1:]
+
+
+def test_insert_into_empty_index(dataset, tmp_path):
+    """由空图层构建的索引插入要素后，精确验证查询只依赖增量层"""
+    pytest.importorskip('osgeo')
+    from geohash_index import GeoHashSpatialIndex
+    engine = GeoHashSpatialIndex(dataset, str(tmp_path / 'gh.spx'),
+                                 precision=5)
+    engine.build_from_bounds(FeatureBounds())
+    engine.insert(7, (100.25, 25.25, 100.3, 25.3))
+    assert engine.query_by_bbox(BBOX, exact_check=True) == [7]
+
+
+def test_refresh_directory_source(tmp_path):
+    """目录数据源（Shapefile 目录）修改后 refresh() 能检测到变化"""
+    pytest.importorskip('osgeo')
+    from synthetic_data import generate_dataset
+    from geohash_index import GeoHashSpatialIndex
+    source = tmp_path / 'shp'
+    extent = (100.0, 25.0, 100.5, 25.5)
+    generate_dataset(str(source / 'data.shp'), 100, size=0.05, extent=extent)
+    engine = GeoHashSpatialIndex(str(source), str(tmp_path / 'gh.spx'),
+                                 precision=5)
+    engine.build_index()
+    assert not engine.source_changed()
+
+    generate_dataset(str(source / 'data.shp'), 120, size=0.05, extent=extent)
+    assert engine.source_changed()
+    assert engine.refresh() > 0
+    assert not engine.source_changed()
+    assert len(engine.query_by_bbox(extent, exact_check=True)) == 120
+
+
+def test_refresh_merges_large_delta(tmp_path):
+    """增量层超过阈值时 refresh() 把它并入主索引"""
+    pytest.importorskip('osgeo')
+    from synthetic_data import generate_dataset
+    from geohash_index import GeoHashSpatialIndex
+    path = str(tmp_path / 'data.gpkg')
+    extent = (100.0, 25.0, 100.5, 25.5)
+    generate_dataset(path, 200, size=0.05, extent=extent)
+    engine = GeoHashSpatialIndex(path, str(tmp_path / 'gh.spx'), precision=5)
+    engine.build_index()
+
+    generate_dataset(path, 200, size=0.05, extent=extent, seed=1)
+    assert engine.refresh() > 0
+    assert not engine.has_delta
+    assert len(engine.query_by_bbox(extent, exact_check=True)) == 200
+
+
+def test_refresh_rebuilds_on_path_change(dataset, tmp_path):
+    """数据源路径与构建时不同时整体重建，而不是把差异写入增量层"""
+    pytest.importorskip('osgeo')
+    from synthetic_data import generate_dataset
+    from geohash_index import GeoHashSpatialIndex
+    index_file = str(tmp_path / 'gh.spx')
+    GeoHashSpatialIndex(dataset, index_file, precision=5).build_index()
+
+    other = str(tmp_path / 'other.gpkg')
+    generate_dataset(other, 50, size=0.05, extent=(100.0, 25.0, 100.5, 25.5))
+    engine = GeoHashSpatialIndex(other, index_file, precision=5)
+    assert engine.source_changed()
+    assert engine.refresh() == 50
+    assert not engine.has_delta
+    assert engine.feature_count == 50
+
+
+def test_geometry_check_missing_feature(dataset, tmp_path):
+    """数据源中不存在的 fid 在几何验证时视为不相交，不影响其余要素"""
+    pytest.importorskip('osgeo')
+    from geohash_index import GeoHashSpatialIndex
+    engine = GeoHashSpatialIndex(dataset, str(tmp_path / 'gh.spx'),
+                                 precision=5)
+    engine.build_index()
+    before = sorted(engine.query_by_bbox(BBOX, geometry_check=True))
+    assert before
+
+    engine.insert(100000, (100.25, 25.25, 100.3, 25.3))
+    assert sorted(engine.query_by_bbox(BBOX, geometry_check=True)) == before
+    offsets, fids = engine.query_by_bboxes([BBOX, BBOX], geometry_check=True)
+    assert sorted(fids[offsets[1]:].tolist()) == before
@@ -0,0 +1,134 @@
+#
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'py'))
+
+pytest.importorskip('osgeo')
+pygeohash = pytest.importorskip('pygeohash')
+
+from index_base import FeatureBounds
+from geohash_index import (GeoHashSpatialIndex, bounds_to_cell_ranges,
+                           encode_cells, decode_cells, codes_to_geohashes,
+                           geohashes_to_codes, bbox_to_geohashes,
+                           bounds_to_geohash_codes, bbox_to_geohash_ranges)
+
+
+def random_points(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-180, 180, n), rng.uniform(-90, 90, n)
+
+
+@pytest.mark.parametrize('precision', [1, 2, 5, 7, 9, 12])
+def test_encode_matches_pygeohash(precision):
+    """点所在网格的编码与 pygeohash.encode 相同"""
+    lon, lat = random_points()
+    ix, _, iy, _ = bounds_to_cell_ranges(lon, lat, lon, lat, precision)
+    hashes = codes_to_geohashes(encode_cells(ix, iy, precision), precision)
+    assert hashes == [
+        pygeohash.encode(y, x, precision)
+        for x, y in zip(lon.tolist(), lat.tolist())
+    ]
+
+
+@pytest.mark.parametrize('precision', [1, 6, 12])
+def test_code_round_trip(precision):
+    """编码与行列号、GeoHash 字符串之间的往返"""
+    lon, lat = random_points(seed=1)
+    ix, _, iy, _ = bounds_to_cell_ranges(lon, lat, lon, lat, precision)
+    codes = encode_cells(ix, iy, precision)
+    dx, dy = decode_cells(codes, precision)
+    assert np.array_equal(dx, ix) and np.array_equal(dy, iy)
+    assert np.array_equal(
+        geohashes_to_codes(codes_to_geohashes(codes, precision), precision),
+        codes)
+
+
+def test_bbox_to_geohashes_small_bbox():
+    """单个网格内的 bbox 只覆盖该网格"""
+    lon, lat = 100.123, 25.456
+    bbox = (lon, lat, lon + 1e-6, lat + 1e-6)
+    assert bbox_to_geohashes(bbox, 6) == [pygeohash.encode(lat, lon, 6)]
+
+
+def random_bboxes(n=30, seed=2):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-179, 170, n)
+    y = rng.uniform(-89, 80, n)
+    size = 10**rng.uniform(-3, 1, (2, n))
+    return np.column_stack([x, y, x + size[0], y + size[1]])
+
+
+def covered(starts, stops, codes):
+    """codes 中每个编码是否落在某个 [start, stop) 区间内"""
+    i = np.searchsorted(starts, codes, side='right') - 1
+    return (i >= 0) & (codes < stops[np.maximum(i, 0)])
+
+
+@pytest.mark.parametrize('precision', [3, 5, 7])
+def test_prefix_ranges_exact(precision):
+    """不限格网数时，前缀区间恰好覆盖与 bbox 相交的全部网格"""
+    for bbox in random_bboxes().tolist():
+        _, codes = bounds_to_geohash_codes(*bbox, precision)
+        if len(codes) > 200000:
+            continue
+        starts, stops = bbox_to_geohash_ranges(bbox, precision)
+        # 区间升序、互不重叠且已合并
+        assert np.all(starts < stops)
+        assert np.all(starts[1:] > stops[:-1])
+        assert covered(starts, stops, codes).all()
+        assert int((stops - starts).sum()) == len(np.unique(codes))
+
+
+@pytest.mark.parametrize('query_precision,max_cells', [(4, None), (7, 64)])
+def test_prefix_ranges_coarse(query_precision, max_cells):
+    """较粗的查询精度或格网数上限只会扩大覆盖，不会漏掉网格"""
+    for bbox in random_bboxes(seed=3).tolist():
+        _, codes = bounds_to_geohash_codes(*bbox, 7)
+        if len(codes) > 200000:
+            continue
+        starts, stops = bbox_to_geohash_ranges(bbox, 7, query_precision,
+                                               max_cells)
+        assert covered(starts, stops, codes).all()
+
+
+@pytest.mark.parametrize('storage,compression', [('dict', None),
+                                                 ('sorted', None),
+                                                 ('csr', None),
+                                                 ('csr', 'varint')])
+def test_exact_check_matches_brute_force(storage, compression, tmp_path):
+    """精确验证后的结果等于逐个比较外包矩形的结果，批量查询结果相同"""
+    rng = np.random.default_rng(4)
+    x = rng.uniform(100, 101, 2000)
+    y = rng.uniform(25, 26, 2000)
+    w, h = rng.exponential(0.01, (2, 2000))
+    bounds = FeatureBounds.from_columns(np.arange(2000) * 2, x, y, x + w,
+                                        y + h)
+    engine = GeoHashSpatialIndex('unused.shp',
+                                 str(tmp_path / 'gh.spx'),
+                                 precision=6,
+                                 storage=storage,
+                                 query_precision=5,
+                                 compression=compression)
+    engine.build_from_bounds(bounds, {'path': None})
+
+    bboxes = np.array([(100.2, 25.2, 100.4, 25.45),
+                       (100.5, 25.5, 100.52, 25.53),
+                       (10.0, 10.0, 11.0, 11.0),
+                       (100.0, 25.0, 101.0, 26.0)])
+    offsets, fids = engine.query_by_bboxes(bboxes, exact_check=True)
+    for i, bbox in enumerate(bboxes.tolist()):
+        expected = bounds.fids[bounds.intersects(bounds.fids, bbox)]
+        candidates, results = engine.query(bbox, exact_check=True)
+        assert np.isin(expected, candidates).all()
+        assert sorted(results.tolist()) == expected.tolist()
+        assert sorted(fids[offsets[i]:offsets[i + 1]].tolist()) == \
+            expected.tolist()
@@ -0,0 +1,87 @@
+#
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'py'))
+
+pytest.importorskip('osgeo')
+h3 = pytest.importorskip('h3')
+
+from index_base import FeatureBounds
+from h3_index import H3SpatialIndex, cell_parents, cell_resolutions
+
+BBOXES = np.array([(100.2, 25.2, 100.4, 25.45),
+                   (100.5, 25.5, 100.52, 25.53),
+                   (100.3001, 25.3001, 100.3002, 25.3002),
+                   (10.0, 10.0, 11.0, 11.0),
+                   (100.0, 25.0, 101.0, 26.0)])
+
+
+def random_cells(res, n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(-80, 80, n).tolist()
+    lng = rng.uniform(-180, 180, n).tolist()
+    cells = [h3.latlng_to_cell(a, b, res) for a, b in zip(lat, lng)]
+    return np.array([h3.str_to_int(cell) for cell in cells], dtype=np.uint64)
+
+
+@pytest.mark.parametrize('res', [1, 7, 15])
+def test_cell_parents(res):
+    """向量化的父单元格与分辨率与 h3 的结果一致"""
+    cells = random_cells(res)
+    assert cell_resolutions(cells).tolist() == [res] * len(cells)
+    for parent_res in range(res + 1):
+        expected = [
+            h3.str_to_int(h3.cell_to_parent(h3.int_to_str(cell), parent_res))
+            for cell in cells.tolist()
+        ]
+        assert cell_parents(cells, parent_res).tolist() == expected
+
+
+@pytest.fixture(scope='module')
+def bounds():
+    """大小跨越几个数量级的外包矩形，大要素 compact 后为粗单元格"""
+    rng = np.random.default_rng(1)
+    x = rng.uniform(100, 101, 300)
+    y = rng.uniform(25, 26, 300)
+    size = 10**rng.uniform(-4, -0.7, (2, 300))
+    return FeatureBounds.from_columns(np.arange(300) * 3, x, y, x + size[0],
+                                      y + size[1])
+
+
+@pytest.mark.parametrize('storage,compression', [('dict', None),
+                                                 ('sorted', None),
+                                                 ('csr', 'varint')])
+@pytest.mark.parametrize('compact', [False, True])
+def test_exact_check_matches_brute_force(storage, compression, compact,
+                                         bounds, tmp_path):
+    """候选包含全部真实结果，精确验证后的结果等于逐个比较外包矩形的结果"""
+    engine = H3SpatialIndex('unused.shp',
+                            str(tmp_path / 'h3.spx'),
+                            resolution=7,
+                            compact=compact,
+                            storage=storage,
+                            compression=compression)
+    engine.build_from_bounds(bounds, {'path': None})
+    if compact:
+        assert len(engine.index_resolutions) > 1
+
+    for _ in range(2):
+        offsets, fids = engine.query_by_bboxes(BBOXES, exact_check=True)
+        for i, bbox in enumerate(BBOXES.tolist()):
+            expected = bounds.fids[bounds.intersects(bounds.fids, bbox)]
+            candidates, results = engine.query(bbox, exact_check=True)
+            assert np.isin(expected, candidates).all()
+            assert sorted(results.tolist()) == expected.tolist()
+            assert sorted(fids[offsets[i]:offsets[i + 1]].tolist()) == \
+                expected.tolist()
+        # 由索引文件重新加载后结果不变
+        engine.load_index()
@@ -0,0 +1,89 @@
+#
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import os
+import struct
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'py'))
+
+import index_file
+from index_file import (ALIGNMENT, open_index_file, read_index_buffer,
+                        write_index_buffer, write_index_file,
+                        index_buffer_size)
+
+HEADER = {'engine': 'geohash', 'resolution': 7, 'meta': {'storage': 'csr'}}
+
+
+def make_arrays():
+    return {
+        'bounds.fids': np.arange(5, dtype=np.int64),
+        'bounds.boxes': np.arange(20, dtype=np.float64).reshape(4, 5),
+        'postings.keys': np.array([3, 2**63 + 1], dtype=np.uint64),
+        'postings.data': np.arange(7, dtype=np.uint8),
+        'delta.tombstones': np.empty(0, dtype=np.int64)
+    }
+
+
+def check_contents(header, arrays, expected):
+    assert header['engine'] == 'geohash'
+    assert header['meta'] == {'storage': 'csr'}
+    assert header['format_version'] == index_file.FORMAT_VERSION
+    assert set(arrays) == set(expected)
+    for name, arr in expected.items():
+        assert arrays[name].dtype == arr.dtype
+        assert np.array_equal(arrays[name], arr)
+
+
+def test_file_round_trip(tmp_path):
+    """写入后以内存映射读出，数组只读、按 ALIGNMENT 对齐"""
+    path = str(tmp_path / 'sub' / 'index.spx')
+    expected = make_arrays()
+    write_index_file(path, HEADER, expected)
+    assert not os.path.exists(path + '.tmp')
+
+    header, arrays = open_index_file(path)
+    check_contents(header, arrays, expected)
+    for arr in arrays.values():
+        assert not arr.flags.writeable
+    for section in header['arrays'].values():
+        assert section['offset'] % ALIGNMENT == 0
+
+
+def test_buffer_round_trip():
+    """缓冲区（共享内存）布局与文件相同"""
+    expected = make_arrays()
+    buf = bytearray(index_buffer_size(HEADER, expected))
+    assert write_index_buffer(buf, HEADER, expected) == len(buf)
+    check_contents(*read_index_buffer(np.frombuffer(buf, dtype=np.uint8)),
+                   expected)
+
+
+def test_reject_bad_magic(tmp_path):
+    path = str(tmp_path / 'index.spx')
+    write_index_file(path, HEADER, make_arrays())
+    with open(path, 'r+b') as f:
+        f.write(b'NOTSPIDX')
+    with pytest.raises(ValueError, match="格式不正确"):
+        open_index_file(path)
+
+
+def test_reject_truncated():
+    with pytest.raises(ValueError, match="格式不正确"):
+        read_index_buffer(np.zeros(4, dtype=np.uint8))
+
+
+def test_reject_other_version(tmp_path):
+    path = str(tmp_path / 'index.spx')
+    write_index_file(path, HEADER, make_arrays())
+    with open(path, 'r+b') as f:
+        f.seek(len(index_file.MAGIC))
+        f.write(struct.pack('<I', index_file.FORMAT_VERSION + 1))
+    with pytest.raises(ValueError, match="版本"):
+        open_index_file(path)
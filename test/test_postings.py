@@ -0,0 +1,106 @@
+#
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'py'))
+
+from postings import (CSRPostings, SortedPostings, varint_encode,
+                      varint_decode)
+
+
+def test_varint_round_trip():
+    """varint 编码往返，含单字节边界与 2^63 以上的值"""
+    rng = np.random.default_rng(0)
+    values = np.concatenate([
+        np.array([0, 1, 127, 128, 16383, 16384, 2**63 - 1, 2**63, 2**64 - 1],
+                 dtype=np.uint64),
+        rng.integers(0, 2**64 - 1, 1000, dtype=np.uint64, endpoint=True)
+    ])
+    data = varint_encode(values)
+    assert data.dtype == np.uint8
+    assert varint_encode([2**64 - 1]).size == 10
+    assert np.array_equal(varint_decode(data), values)
+
+
+def test_varint_empty():
+    assert varint_encode([]).size == 0
+    assert varint_decode(np.empty(0, dtype=np.uint8)).size == 0
+
+
+def random_pairs(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 300, n), rng.integers(0, 10**12, n)
+
+
+def brute_force(keys, fids, starts, stops):
+    mask = np.zeros(len(keys), dtype=bool)
+    for start, stop in zip(starts, stops):
+        mask |= (keys >= start) & (keys < stop)
+    return np.unique(fids[mask])
+
+
+@pytest.mark.parametrize('compression', [None, 'varint'])
+def test_csr_lookup_ranges(compression):
+    """CSR（含 varint 压缩）区间查找与逐对比较结果一致"""
+    keys, fids = random_pairs()
+    postings = CSRPostings.from_pairs(keys, fids, compression=compression)
+    assert postings.compression == compression
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        starts = np.sort(rng.integers(0, 320, 3))
+        stops = starts + rng.integers(0, 30, 3)
+        assert np.array_equal(postings.lookup_ranges(starts, stops),
+                              brute_force(keys, fids, starts, stops))
+
+
+def test_csr_varint_matches_uncompressed():
+    """压缩与未压缩的 CSR 展开为相同的字典，批量查找结果相同"""
+    keys, fids = random_pairs(seed=2)
+    plain = CSRPostings.from_pairs(keys, fids)
+    packed = CSRPostings.from_pairs(keys, fids, compression='varint')
+    assert plain.to_dict() == packed.to_dict()
+
+    query_ids = np.array([0, 0, 1, 2])
+    starts = np.array([0, 100, 50, 400])
+    stops = np.array([10, 120, 51, 500])
+    for a, b in zip(plain.lookup_ranges_batch(query_ids, starts, stops, 3),
+                    packed.lookup_ranges_batch(query_ids, starts, stops, 3)):
+        assert np.array_equal(a, b)
+
+
+@pytest.mark.parametrize('compression', [None, 'varint'])
+def test_csr_empty(compression):
+    """没有任何 (key, fid) 对的倒排表查找返回空结果"""
+    postings = CSRPostings.from_pairs(np.empty(0, dtype=np.int64),
+                                      np.empty(0, dtype=np.int64),
+                                      compression=compression)
+    assert len(postings) == 0
+    assert postings.lookup_ranges(np.array([0]), np.array([10])).size == 0
+    offsets, fids = postings.lookup_ranges_batch(np.array([0]), np.array([0]),
+                                                 np.array([10]), 2)
+    assert offsets.tolist() == [0, 0, 0] and fids.size == 0
+
+
+def test_csr_restore_from_arrays():
+    """to_arrays/from_arrays 往返后查找结果不变"""
+    keys, fids = random_pairs(seed=3)
+    packed = CSRPostings.from_pairs(keys, fids, compression='varint')
+    restored = CSRPostings.from_arrays(packed.to_arrays())
+    assert restored.compression == 'varint'
+    assert restored.to_dict() == packed.to_dict()
+
+
+def test_sorted_lookup_ranges():
+    keys, fids = random_pairs(seed=4)
+    postings = SortedPostings.from_pairs(keys, fids)
+    starts, stops = np.array([5, 200]), np.array([40, 260])
+    assert np.array_equal(postings.lookup_ranges(starts, stops),
+                          brute_force(keys, fids, starts, stops))
@@ -0,0 +1,69 @@
+#
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'py'))
+
+from index_base import FeatureBounds
+
+BBOX = (100.0, 25.0, 101.0, 26.0)
+
+
+@pytest.fixture
+def bounds():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(100, 101, 500)
+    y = rng.uniform(25, 26, 500)
+    return FeatureBounds.from_columns(np.arange(500) * 3, x, y, x + 0.01,
+                                      y + 0.01)
+
+
+def test_disk_files_missing(bounds, tmp_path):
+    """disk 后端的 .dat/.idx 缺失时由外包矩形重新装载，而不是打开一棵空树"""
+    pytest.importorskip('osgeo')
+    from rtree_index import RtreeIndex
+    index_file = str(tmp_path / 'rtree.spx')
+    engine = RtreeIndex('unused.shp', index_file, backend='disk')
+    engine.build_from_bounds(bounds, {'path': None})
+    assert len(engine.query_by_bbox(BBOX)) == len(bounds)
+    engine.rtree_idx.close()
+    for ext in ('dat', 'idx'):
+        os.remove(str(tmp_path / f'rtree.{ext}'))
+
+    loaded = RtreeIndex('unused.shp', index_file)
+    assert len(loaded.query_by_bbox(BBOX)) == len(bounds)
+    assert os.path.exists(str(tmp_path / 'rtree.dat'))
+
+
+def test_attach_shared_disk(bounds, tmp_path):
+    """挂载共享内存时打开导出方的 .dat/.idx，不在挂载方目录创建空树"""
+    pytest.importorskip('osgeo')
+    from rtree_index import RtreeIndex
+    engine = RtreeIndex('unused.shp', str(tmp_path / 'export' / 'rtree.spx'),
+                        backend='disk')
+    engine.build_from_bounds(bounds, {'path': None})
+    engine.insert(10**6, (100.3, 25.3, 100.31, 25.31))
+    expected = sorted(engine.query_by_bbox(BBOX, exact_check=True))
+
+    shm = engine.export_shared()
+    try:
+        other = tmp_path / 'other'
+        other.mkdir()
+        attached = RtreeIndex('unused.shp', str(other / 'rtree.spx'))
+        attached.attach_shared(shm.name)
+        assert sorted(attached.query_by_bbox(BBOX,
+                                             exact_check=True)) == expected
+        assert not os.listdir(str(other))
+        attached.rtree_idx.close()
+        attached._shared_memory.close()
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,94 @@
+#
+# created by:
+#   @author: vlv-squid
+#   @date: 2026-10-17
+#
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'py'))
+
+pytest.importorskip('osgeo')
+s2sphere = pytest.importorskip('s2sphere')
+
+from index_base import FeatureBounds
+from s2_index import S2SpatialIndex
+
+BBOXES = np.array([(100.2, 25.2, 100.4, 25.45),
+                   (100.5, 25.5, 100.52, 25.53),
+                   (100.3001, 25.3001, 100.3002, 25.3002),
+                   (10.0, 10.0, 11.0, 11.0),
+                   (100.0, 25.0, 101.0, 26.0)])
+
+
+@pytest.fixture(scope='module')
+def bounds():
+    """大小跨越几个数量级的外包矩形，多层级覆盖时落在不同层级"""
+    rng = np.random.default_rng(0)
+    x = rng.uniform(100, 101, 500)
+    y = rng.uniform(25, 26, 500)
+    size = 10**rng.uniform(-4, -0.5, (2, 500))
+    return FeatureBounds.from_columns(np.arange(500) * 3, x, y, x + size[0],
+                                      y + size[1])
+
+
+def make_engine(tmp_path, bounds, **kwargs):
+    engine = S2SpatialIndex('unused.shp', str(tmp_path / 's2.spx'), **kwargs)
+    engine.build_from_bounds(bounds, {'path': None})
+    return engine
+
+
+def check_brute_force(engine, bounds):
+    """候选包含全部真实结果，精确验证后的结果等于逐个比较外包矩形的结果"""
+    offsets, fids = engine.query_by_bboxes(BBOXES, exact_check=True)
+    for i, bbox in enumerate(BBOXES.tolist()):
+        expected = bounds.fids[bounds.intersects(bounds.fids, bbox)]
+        candidates, results = engine.query(bbox, exact_check=True)
+        assert np.isin(expected, candidates).all()
+        assert sorted(results.tolist()) == expected.tolist()
+        assert sorted(fids[offsets[i]:offsets[i + 1]].tolist()) == \
+            expected.tolist()
+
+
+@pytest.mark.parametrize('storage,compression', [('dict', None),
+                                                 ('sorted', None),
+                                                 ('csr', 'varint')])
+def test_single_level(storage, compression, bounds, tmp_path):
+    engine = make_engine(tmp_path, bounds, resolution=10, storage=storage,
+                         compression=compression)
+    check_brute_force(engine, bounds)
+
+
+@pytest.mark.parametrize('storage,compression', [('sorted', None),
+                                                 ('csr', None),
+                                                 ('csr', 'varint')])
+def test_multi_level(storage, compression, bounds, tmp_path):
+    """多层级索引：粗单元格中的大要素与细单元格中的小要素都能查到"""
+    engine = make_engine(tmp_path, bounds, resolution=14, min_level=6,
+                         max_cells=4, storage=storage,
+                         compression=compression)
+    levels = {
+        s2sphere.CellId(int(key)).level()
+        for key in engine.s2_index.keys.tolist()
+    }
+    assert len(levels) > 1
+    check_brute_force(engine, bounds)
+
+    engine.load_index()
+    check_brute_force(engine, bounds)
+
+
+def test_query_ranges_include_ancestors(tmp_path):
+    """查询单元格在 [min_level, level) 各层的祖先以精确区间出现"""
+    bounds = FeatureBounds.from_columns([1], [100.0], [25.0], [101.0], [26.0])
+    engine = make_engine(tmp_path, bounds, resolution=14, min_level=4,
+                         max_cells=1, storage='sorted')
+    bbox = (100.3001, 25.3001, 100.3002, 25.3002)
+    starts, stops = engine._query_ranges(bbox)
+    # 大要素只有粗单元格，必须经祖先的精确区间命中
+    assert np.isin(engine.s2_index.keys, starts[stops - starts == 1]).any()
+    assert engine.query_by_bbox(bbox) == [1]